@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import tempfile
+
+from linamp_xmms import PlaylistItem, write_playlist_snapshot, read_playlist_snapshot
+from bench_playlist_memory import make_records
+
+SIZES = (10000, 100000, 1000000)
+
+def measure(count, directory):
+    items = [PlaylistItem.from_dict(record) for record in make_records(count)]
+    json_path = os.path.join(directory, f"playlist-{count}.json")
+    snapshot_path = os.path.join(directory, f"playlist-{count}.bin")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump([item.to_dict() for item in items], f, indent=2, ensure_ascii=False)
+    started = time.perf_counter()
+    with open(snapshot_path, 'wb') as f:
+        write_playlist_snapshot(f, items, 0)
+    write_elapsed = time.perf_counter() - started
+    del items
+    started = time.perf_counter()
+    with open(json_path, 'r', encoding='utf-8') as f:
+        loaded = [PlaylistItem.from_dict(entry) for entry in json.load(f)]
+    json_elapsed = time.perf_counter() - started
+    del loaded
+    started = time.perf_counter()
+    sequence, loaded = read_playlist_snapshot(snapshot_path)
+    snapshot_elapsed = time.perf_counter() - started
+    return (len(loaded), os.path.getsize(json_path), os.path.getsize(snapshot_path),
+            json_elapsed, snapshot_elapsed, write_elapsed)
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    print(f"{'tracks':>10} {'json MB':>8} {'bin MB':>7} {'json load (s)':>14} {'bin load (s)':>13} {'bin write (s)':>14}")
+    with tempfile.TemporaryDirectory(prefix="linamp-bench-") as directory:
+        for count in sizes:
+            tracks, json_size, snapshot_size, json_elapsed, snapshot_elapsed, write_elapsed = measure(count, directory)
+            print(f"{tracks:>10} {json_size / 2 ** 20:>8.1f} {snapshot_size / 2 ** 20:>7.1f} "
+                  f"{json_elapsed:>14.2f} {snapshot_elapsed:>13.2f} {write_elapsed:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+
+import linamp_xmms
+from linamp_xmms import PlaylistItem, TrackList, TrackStore, read_playlist_snapshot, write_playlist_snapshot
+
+SIZES = (10000, 100000, 1000000)
+
+def make_records(count):
+    random.seed(count)
+    artists = [f"Artist {i}" for i in range(max(1, count // 150))]
+    records = []
+    for i in range(count):
+        if i % 12 == 0:
+            artist = random.choice(artists)
+        album = f"Album {i // 12}"
+        records.append({
+            'path': f"/home/user/Music/{artist}/{album}/{i % 12 + 1:02d} Track {i}.flac",
+            'title': f"Track {i}",
+            'duration': 120 + i % 300,
+            'artist': artist,
+            'album': album,
+            'genre': random.choice(("Rock", "Jazz", "Electronic", "Classical")),
+            'play_count': 0,
+            'last_played': 0.0,
+        })
+    return json.loads(json.dumps(records))
+
+def run(build, traced):
+    linamp_xmms.track_store = TrackStore()
+    if traced:
+        tracemalloc.start()
+    started = time.perf_counter()
+    playlist = build()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory() if traced else (0, 0)
+    if traced:
+        tracemalloc.stop()
+    return playlist, elapsed, current, peak
+
+def measure(count, directory):
+    records = make_records(count)
+    build = lambda: TrackList(PlaylistItem.from_dict(record) for record in records)
+    playlist, build_elapsed, _, _ = run(build, False)
+    snapshot_path = os.path.join(directory, f"playlist-{count}.bin")
+    with open(snapshot_path, 'wb') as f:
+        write_playlist_snapshot(f, playlist, 0)
+    del playlist
+    _, _, build_current, build_peak = run(build, True)
+    del records
+    load = lambda: read_playlist_snapshot(snapshot_path)[1]
+    _, load_elapsed, _, _ = run(load, False)
+    playlist, _, load_current, load_peak = run(load, True)
+    return len(playlist), build_elapsed, build_current, load_elapsed, load_current, max(build_peak, load_peak)
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    print(f"{'tracks':>10} {'build (s)':>10} {'bytes/track':>12} {'load (s)':>9} {'bytes/track':>12} {'peak MB':>9}")
+    with tempfile.TemporaryDirectory(prefix="linamp-bench-") as directory:
+        for count in sizes:
+            tracks, build_elapsed, build_current, load_elapsed, load_current, peak = measure(count, directory)
+            print(f"{tracks:>10} {build_elapsed:>10.2f} {build_current / tracks:>12.0f} {load_elapsed:>9.2f} "
+                  f"{load_current / tracks:>12.0f} {peak / 2 ** 20:>9.1f}")
+
+if __name__ == "__main__":
+    main()
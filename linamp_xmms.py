@@ -3,9 +3,25 @@ from ast import Pass
 import os
 import sys
 import json
+import re
 import tempfile
 import random
 import time
+import threading
+import heapq
+import bisect
+import sqlite3
+import mmap
+import struct
+import hashlib
+import unicodedata
+import locale
+import stat as stat_module
+from array import array
+from collections import deque
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dataclasses import dataclass, asdict
 import gi
 
@@ -16,30 +32,430 @@ try:
 except ValueError:
     sys.exit(1)
 
+try:
+    gi.require_version('GstPbutils', '1.0')
+    from gi.repository import GstPbutils
+except (ValueError, ImportError):
+    GstPbutils = None
+
 from typing import Dict, Any, List, Optional, Union, Tuple
 from pathlib import Path
 
-SETTINGS_FILE = Path(__file__).parent / "linamp_settings.json"
+STATE_DIR = os.path.join(os.environ.get('XDG_STATE_HOME') or os.path.expanduser("~/.local/state"), "linamp")
+SETTINGS_FILE = Path(STATE_DIR) / "settings.json"
+LEGACY_SETTINGS_FILE = Path(__file__).parent / "linamp_settings.json"
+SETTINGS_WRITE_INTERVAL = 1.0
+POSITION_CHECKPOINT_FILE = os.path.join(STATE_DIR, "position.bin")
+POSITION_CHECKPOINT_INTERVAL = 3
+AUDIO_EXTENSIONS = {'.mp3', '.mp4', '.flac', '.ogg', '.wav', '.m4a', '.wma', '.aac', '.opus'}
+SCAN_BATCH_SIZE = 500
+SCAN_MAX_PENDING_BATCHES = 4
+WATCHED_FOLDERS_FILE = os.path.expanduser("~/.config/linamp/watched_folders.json")
+WATCH_DEBOUNCE_INTERVAL = 500
+WATCH_MAX_MONITORS = 4096
+WATCH_MONITOR_SHARE = 0.5
+INOTIFY_MAX_WATCHES_FILE = "/proc/sys/fs/inotify/max_user_watches"
+WATCH_RESCAN_INTERVAL = 300
+CACHE_DIR = os.path.expanduser("~/.cache/linamp")
+METADATA_CACHE_FILE = os.path.join(CACHE_DIR, "metadata.db")
+METADATA_PROBE_TIMEOUT = 5
+METADATA_FLUSH_INTERVAL = 250
+SMART_PLAYLISTS_FILE = os.path.expanduser("~/.config/linamp/smart_playlists.json")
+SMART_TIMER_INTERVAL = 60
+SEARCH_DEBOUNCE_INTERVAL = 150
+SEARCH_WARM_CHUNK = 2000
+SEARCH_PREFIX_MIN_LENGTH = 3
+SEARCH_SHORT_PREFIX_WORDS = 256
+LIBRARY_SEARCH_LIMIT = 500
+SEARCH_FUZZY_MIN_LENGTH = 4
+PLAYLIST_FILE = os.path.expanduser("~/.config/linamp/playlist.json")
+PLAYLIST_JOURNAL_FILE = os.path.expanduser("~/.config/linamp/playlist.journal")
+PLAYLIST_SNAPSHOT_FILE = os.path.expanduser("~/.config/linamp/playlist.bin")
+PLAYLIST_SNAPSHOT_MAGIC = b'LAPB'
+PLAYLIST_SNAPSHOT_VERSION = 2
+PLAYLIST_SNAPSHOT_HEADER = struct.Struct('<4sIQQQQ')
+JOURNAL_COMPACT_RECORDS = 2000
+JOURNAL_COMPACT_BYTES = 8 * 1024 * 1024
+PLAYLIST_WRITE_INTERVAL = 1.0
+HISTORY_MAX_STEPS = 100
+HISTORY_MAX_CELLS = 2000000
+LIBRARY_DB_FILE = os.path.join(os.path.expanduser("~/.local/share/linamp"), "library.db")
+PREFLIGHT_TIMEOUT = 10
+PREFLIGHT_IDLE_DELAY = 0.05
+PREFLIGHT_FLUSH_INTERVAL = 1000
+IO_TIMEOUT_MAIN = 0.2
+IO_TIMEOUT_WORKER = 10.0
+STAT_CACHE_TTL = 5.0
+STAT_CACHE_MAX_ENTRIES = 100000
+MOUNT_TABLE_TTL = 30.0
+MOUNT_RETRY_INTERVAL = 15.0
+LOCAL_MOUNT_CONCURRENCY = 8
+NETWORK_MOUNT_CONCURRENCY = 2
+NETWORK_FS_TYPES = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'fuse.rclone', 'fuse.smbnetfs',
+    '9p', 'ceph', 'glusterfs', 'fuse.glusterfs', 'davfs', 'fuse.davfs2', 'afs', 'lustre'
+}
+
+class FileProbe:
+    _MISSING = object()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executors = {}
+        self._stalled_until = {}
+        self._stat_cache = {}
+        self._mounts = []
+        self._mounts_loaded_at = 0.0
+
+    def _load_mounts(self):
+        mounts = []
+        try:
+            with open('/proc/self/mounts', 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 3:
+                        mount_point = fields[1].replace('\\040', ' ')
+                        mounts.append((mount_point, fields[2]))
+        except OSError:
+            mounts.append(('/', ''))
+        mounts.sort(key=lambda mount: len(mount[0]), reverse=True)
+        self._mounts = mounts
+        self._mounts_loaded_at = time.monotonic()
+
+    def mount_for(self, path: str) -> Tuple[str, str]:
+        with self._lock:
+            if time.monotonic() - self._mounts_loaded_at > MOUNT_TABLE_TTL:
+                self._load_mounts()
+            mounts = self._mounts
+        for mount_point, fs_type in mounts:
+            if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+                return mount_point, fs_type
+        return '/', ''
+
+    def is_network_path(self, path: str) -> bool:
+        return self.mount_for(path)[1] in NETWORK_FS_TYPES
+
+    def _executor_for(self, mount_point: str, fs_type: str) -> ThreadPoolExecutor:
+        with self._lock:
+            executor = self._executors.get(mount_point)
+            if executor is None:
+                workers = NETWORK_MOUNT_CONCURRENCY if fs_type in NETWORK_FS_TYPES else LOCAL_MOUNT_CONCURRENCY
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="linamp-io")
+                self._executors[mount_point] = executor
+            return executor
+
+    def call(self, path: str, func, *args, timeout: float = None):
+        if timeout is None:
+            timeout = IO_TIMEOUT_MAIN if threading.current_thread() is threading.main_thread() else IO_TIMEOUT_WORKER
+        mount_point, fs_type = self.mount_for(path)
+        if self._stalled_until.get(mount_point, 0.0) > time.monotonic():
+            raise TimeoutError(f"{mount_point} is not responding")
+        future = self._executor_for(mount_point, fs_type).submit(func, *args)
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._stalled_until[mount_point] = time.monotonic() + MOUNT_RETRY_INTERVAL
+            raise TimeoutError(f"{mount_point} is not responding")
+        self._stalled_until.pop(mount_point, None)
+        return result
+
+    def stat(self, path: str, timeout: float = None) -> Optional[os.stat_result]:
+        now = time.monotonic()
+        cached = self._stat_cache.get(path)
+        if cached is not None and cached[0] > now:
+            return None if cached[1] is self._MISSING else cached[1]
+        try:
+            result = self.call(path, os.stat, path, timeout=timeout)
+        except (FileNotFoundError, NotADirectoryError):
+            result = self._MISSING
+        except TimeoutError:
+            raise
+        except OSError:
+            return None
+        if len(self._stat_cache) >= STAT_CACHE_MAX_ENTRIES:
+            self._stat_cache.clear()
+        self._stat_cache[path] = (now + STAT_CACHE_TTL, result)
+        return None if result is self._MISSING else result
+
+    def exists(self, path: str, timeout: float = None) -> Optional[bool]:
+        try:
+            return self.stat(path, timeout) is not None
+        except TimeoutError:
+            return None
+
+    def isfile(self, path: str, timeout: float = None) -> Optional[bool]:
+        try:
+            st = self.stat(path, timeout)
+        except TimeoutError:
+            return None
+        return st is not None and stat_module.S_ISREG(st.st_mode)
+
+    def isdir(self, path: str, timeout: float = None) -> Optional[bool]:
+        try:
+            st = self.stat(path, timeout)
+        except TimeoutError:
+            return None
+        return st is not None and stat_module.S_ISDIR(st.st_mode)
+
+    def known_missing(self, path: str) -> bool:
+        cached = self._stat_cache.get(path)
+        return cached is not None and cached[1] is self._MISSING and cached[0] > time.monotonic()
+
+    def invalidate(self, path: str = None):
+        if path is None:
+            self._stat_cache.clear()
+        else:
+            self._stat_cache.pop(path, None)
+
+    def shutdown(self):
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+file_probe = FileProbe()
+
+def normalize_track_path(path: str) -> str:
+    path = str(path)
+    if (path.startswith('/') and not path.startswith('//') and not path.endswith(('/', '/.', '/..'))
+            and '//' not in path and '/./' not in path and '/../' not in path):
+        return path
+    return os.path.abspath(os.path.expanduser(path))
+
+def intern_tag(value):
+    if type(value) is str and value:
+        return sys.intern(value)
+    return value
+
+def split_track_path(path: str) -> Tuple[str, str]:
+    folder, _, name = normalize_track_path(path).rpartition('/')
+    return sys.intern(folder + '/'), name
+
+PLAYABLE_STATES = (None, False, True)
+
+class TrackStore:
+    def __init__(self):
+        self.folders = []
+        self.tags = ['']
+        self.heap = bytearray()
+        self.folder = array('I')
+        self.name_start = array('Q')
+        self.name_size = array('I')
+        self.title_start = array('Q')
+        self.title_size = array('I')
+        self.duration = array('q')
+        self.artist = array('I')
+        self.album = array('I')
+        self.genre = array('I')
+        self.play_count = array('q')
+        self.last_played = array('d')
+        self.playable = bytearray()
+        self._folder_ids = {}
+        self._tag_ids = {'': 0}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.playable)
+
+    def folder_id(self, folder: str) -> int:
+        index = self._folder_ids.get(folder)
+        if index is None:
+            with self._lock:
+                index = self._folder_ids.get(folder)
+                if index is None:
+                    self.folders.append(sys.intern(folder))
+                    index = self._folder_ids[folder] = len(self.folders) - 1
+        return index
+
+    def find_folder(self, folder: str) -> Optional[int]:
+        return self._folder_ids.get(folder)
+
+    def tag_id(self, value) -> int:
+        if not value:
+            return 0
+        index = self._tag_ids.get(value)
+        if index is None:
+            with self._lock:
+                index = self._tag_ids.get(value)
+                if index is None:
+                    self.tags.append(intern_tag(str(value)))
+                    index = self._tag_ids[value] = len(self.tags) - 1
+        return index
+
+    def text(self, start: int, size: int) -> str:
+        return self.heap[start:start + size].decode('utf-8', 'surrogateescape')
+
+    def store_text(self, value: str) -> Tuple[int, int]:
+        data = value.encode('utf-8', 'surrogateescape')
+        with self._lock:
+            start = len(self.heap)
+            self.heap += data
+        return start, len(data)
+
+    def add(self, path: str, title: str, duration: int, artist: str, album: str, genre: str,
+            play_count: int, last_played: float, playable: Optional[bool]) -> int:
+        folder, name = split_track_path(path)
+        folder_id = self.folder_id(folder)
+        tag_ids = self.tag_id(artist), self.tag_id(album), self.tag_id(genre)
+        name_data = name.encode('utf-8', 'surrogateescape')
+        title_data = title.encode('utf-8', 'surrogateescape') if title and title != name else None
+        with self._lock:
+            name_start = len(self.heap)
+            self.heap += name_data
+            title_start = name_start
+            if title_data is not None:
+                title_start = len(self.heap)
+                self.heap += title_data
+            self.folder.append(folder_id)
+            self.name_start.append(name_start)
+            self.name_size.append(len(name_data))
+            self.title_start.append(title_start)
+            self.title_size.append(len(name_data if title_data is None else title_data))
+            self.duration.append(int(duration or 0))
+            self.artist.append(tag_ids[0])
+            self.album.append(tag_ids[1])
+            self.genre.append(tag_ids[2])
+            self.play_count.append(int(play_count or 0))
+            self.last_played.append(float(last_played or 0.0))
+            self.playable.append(PLAYABLE_STATES.index(playable))
+            return len(self.playable) - 1
+
+    def extend(self, heap: bytes, folder: array, name_start: array, name_size: array, title_start: array,
+               title_size: array, duration: array, artist: array, album: array, genre: array,
+               play_count: array, last_played: array) -> range:
+        with self._lock:
+            base = len(self.heap)
+            first = len(self.playable)
+            self.heap += heap
+            self.folder.extend(folder)
+            self.name_start.extend(array('Q', map(base.__add__, name_start)))
+            self.name_size.extend(name_size)
+            self.title_start.extend(array('Q', map(base.__add__, title_start)))
+            self.title_size.extend(title_size)
+            self.duration.extend(duration)
+            self.artist.extend(artist)
+            self.album.extend(album)
+            self.genre.extend(genre)
+            self.play_count.extend(play_count)
+            self.last_played.extend(last_played)
+            self.playable.extend(bytes(len(folder)))
+            return range(first, len(self.playable))
+
+track_store = TrackStore()
 
-@dataclass
 class PlaylistItem:
-    path: str
-    title: str = ""
-    duration: int = 0
+    __slots__ = ('id',)
 
-    def __post_init__(self):
-        self.path = os.path.abspath(os.path.expanduser(str(self.path)))
-        if not self.title:
-            self.title = os.path.basename(self.path)
-        if hasattr(self, 'filename') and not hasattr(self, 'path'):
-            self.path = os.path.abspath(os.path.expanduser(str(self.filename)))
-            delattr(self, 'filename')
+    def __init__(self, path: str, title: str = "", duration: int = 0, artist: str = "", album: str = "",
+                 genre: str = "", play_count: int = 0, last_played: float = 0.0, playable: Optional[bool] = None):
+        self.id = track_store.add(path, title, duration, artist, album, genre, play_count, last_played, playable)
+
+    @classmethod
+    def view(cls, row: int) -> 'PlaylistItem':
+        item = object.__new__(cls)
+        item.id = row
+        return item
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PlaylistItem) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return self.id
+
+    def __repr__(self) -> str:
+        return f"PlaylistItem({self.id}, {self.path!r})"
+
+    @property
+    def folder(self) -> str:
+        return track_store.folders[track_store.folder[self.id]]
+
+    @property
+    def name(self) -> str:
+        return track_store.text(track_store.name_start[self.id], track_store.name_size[self.id])
+
+    @property
+    def path(self) -> str:
+        return self.folder + self.name
+
+    @property
+    def title(self) -> str:
+        return track_store.text(track_store.title_start[self.id], track_store.title_size[self.id])
+
+    @title.setter
+    def title(self, value: str):
+        store = track_store
+        if value == self.name:
+            store.title_start[self.id], store.title_size[self.id] = store.name_start[self.id], store.name_size[self.id]
+        else:
+            store.title_start[self.id], store.title_size[self.id] = store.store_text(value or "")
+
+    @property
+    def duration(self) -> int:
+        return track_store.duration[self.id]
+
+    @duration.setter
+    def duration(self, value: int):
+        track_store.duration[self.id] = int(value or 0)
+
+    @property
+    def artist(self) -> str:
+        return track_store.tags[track_store.artist[self.id]]
+
+    @artist.setter
+    def artist(self, value: str):
+        track_store.artist[self.id] = track_store.tag_id(value)
+
+    @property
+    def album(self) -> str:
+        return track_store.tags[track_store.album[self.id]]
+
+    @album.setter
+    def album(self, value: str):
+        track_store.album[self.id] = track_store.tag_id(value)
+
+    @property
+    def genre(self) -> str:
+        return track_store.tags[track_store.genre[self.id]]
+
+    @genre.setter
+    def genre(self, value: str):
+        track_store.genre[self.id] = track_store.tag_id(value)
+
+    @property
+    def play_count(self) -> int:
+        return track_store.play_count[self.id]
+
+    @play_count.setter
+    def play_count(self, value: int):
+        track_store.play_count[self.id] = int(value or 0)
+
+    @property
+    def last_played(self) -> float:
+        return track_store.last_played[self.id]
+
+    @last_played.setter
+    def last_played(self, value: float):
+        track_store.last_played[self.id] = float(value or 0.0)
+
+    @property
+    def playable(self) -> Optional[bool]:
+        return PLAYABLE_STATES[track_store.playable[self.id]]
+
+    @playable.setter
+    def playable(self, value: Optional[bool]):
+        track_store.playable[self.id] = PLAYABLE_STATES.index(value)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             'path': self.path,
             'title': self.title,
-            'duration': self.duration
+            'duration': self.duration,
+            'artist': self.artist,
+            'album': self.album,
+            'genre': self.genre,
+            'play_count': self.play_count,
+            'last_played': self.last_played
         }
 
     def to_json(self) -> str:
@@ -57,10 +473,55 @@ class PlaylistItem:
         return cls(**item_data)
 
     def exists(self) -> bool:
-        return os.path.isfile(self.path)
+        return file_probe.isfile(self.path) is not False
 
     def get_display_name(self) -> str:
-        return self.title if self.title else os.path.basename(self.path)
+        name = self.title if self.title else self.name
+        return f"⚠ {name}" if self.playable is False else name
+
+class TrackList:
+    __slots__ = ('ids',)
+
+    def __init__(self, items=()):
+        self.ids = array('I', items.ids if isinstance(items, TrackList) else [item.id for item in items])
+
+    @classmethod
+    def from_ids(cls, ids) -> 'TrackList':
+        tracks = object.__new__(cls)
+        tracks.ids = array('I', ids)
+        return tracks
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self):
+        return map(PlaylistItem.view, self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(map(PlaylistItem.view, self.ids[index]))
+        return PlaylistItem.view(self.ids[index])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.ids[index] = value.ids if isinstance(value, TrackList) else array('I', [item.id for item in value])
+        else:
+            self.ids[index] = value.id
+
+    def __delitem__(self, index):
+        del self.ids[index]
+
+    def append(self, item: PlaylistItem):
+        self.ids.append(item.id)
+
+    def extend(self, items):
+        self.ids.extend(items.ids if isinstance(items, TrackList) else array('I', [item.id for item in items]))
+
+    def clear(self):
+        del self.ids[:]
+
+    def copy(self) -> 'TrackList':
+        return TrackList.from_ids(self.ids)
 
 @dataclass
 class PlayerSettings:
@@ -123,6 +584,1897 @@ class PlayerSettings:
         )
         return settings
 
+class SettingsStore:
+    def __init__(self, path: Path = SETTINGS_FILE, legacy_path: Path = LEGACY_SETTINGS_FILE,
+                 interval: float = SETTINGS_WRITE_INTERVAL):
+        self.path = Path(path)
+        self.legacy_path = Path(legacy_path)
+        self.interval = interval
+        self.dirty = set()
+        self._saved = {}
+        self._pending = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._thread = None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        for path in (self.path, self.legacy_path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(data, dict):
+                if path == self.path:
+                    try:
+                        self._saved = asdict(PlayerSettings.from_dict(data))
+                    except (TypeError, ValueError):
+                        pass
+                return data
+        return None
+
+    def save(self, settings: PlayerSettings) -> bool:
+        snapshot = asdict(settings)
+        with self._lock:
+            self.dirty = {key for key, value in snapshot.items() if self._saved.get(key) != value}
+            if not self.dirty:
+                self._pending = None
+                return False
+            self._pending = snapshot
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="settings-writer", daemon=True)
+                self._thread.start()
+            self._wake.set()
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._closing.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+            if snapshot is not None:
+                try:
+                    self._write(snapshot)
+                except Exception:
+                    with self._lock:
+                        if self._pending is None:
+                            self._pending = snapshot
+                    if not self._closing.is_set():
+                        self._wake.set()
+                        continue
+                else:
+                    with self._lock:
+                        self._saved = snapshot
+                        if self._pending is None:
+                            self.dirty.clear()
+            if self._closing.is_set() and not self._wake.is_set():
+                with self._lock:
+                    if not self._wake.is_set():
+                        self._thread = None
+                        return
+
+    def _write(self, snapshot: Dict[str, Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(prefix='.settings_', suffix='.tmp', dir=str(self.path.parent), text=True)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.path)
+        except Exception:
+            try:
+                os.unlink(temp_file)
+            except OSError:
+                pass
+            raise
+
+    def flush(self, timeout: float = 5.0):
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        self._closing.set()
+        self._wake.set()
+        thread.join(timeout)
+        with self._lock:
+            if self._thread is None:
+                self._closing.clear()
+
+class PositionCheckpoint:
+    MAGIC = b'LAPC'
+    RECORD = struct.Struct('<4sQd')
+    SIZE = 32
+
+    def __init__(self, path: str = POSITION_CHECKPOINT_FILE):
+        self.path = path
+        self._map = None
+        self._last = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def track_id(path: str) -> int:
+        digest = hashlib.blake2b(path.encode('utf-8', 'surrogateescape'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    @classmethod
+    def _checksum(cls, payload: bytes) -> bytes:
+        return hashlib.blake2b(payload, digest_size=4).digest()
+
+    def read(self) -> Optional[Tuple[int, float]]:
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read(self.SIZE)
+        except OSError:
+            return None
+        size = self.RECORD.size
+        if len(data) < size + 4 or self._checksum(data[:size]) != data[size:size + 4]:
+            return None
+        magic, track_id, position = self.RECORD.unpack_from(data)
+        if magic != self.MAGIC:
+            return None
+        return track_id, position
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self.SIZE:
+                os.ftruncate(fd, self.SIZE)
+            self._map = mmap.mmap(fd, self.SIZE)
+        finally:
+            os.close(fd)
+
+    def write(self, path: str, position: float):
+        record = (path, round(max(0.0, position), 1))
+        if record == self._last:
+            return
+        try:
+            if self._map is None:
+                self._open()
+            payload = self.RECORD.pack(self.MAGIC, self.track_id(path), record[1])
+            self._map[:len(payload) + 4] = payload + self._checksum(payload)
+        except (OSError, ValueError):
+            return
+        self._last = record
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="position-checkpoint", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            mapping = self._map
+            if mapping is None:
+                return
+            try:
+                mapping.flush()
+            except (OSError, ValueError):
+                pass
+
+    def close(self):
+        mapping, self._map = self._map, None
+        self._wake.set()
+        if mapping is not None:
+            try:
+                mapping.flush()
+                mapping.close()
+            except (OSError, ValueError, BufferError):
+                pass
+
+@dataclass
+class TrackMetadata:
+    duration: int = 0
+    artist: str = ""
+    album: str = ""
+    codec: str = ""
+    bitrate: int = 0
+    genre: str = ""
+    size: int = 0
+
+    def apply_to(self, item: PlaylistItem):
+        if self.duration > 0:
+            item.duration = self.duration
+        if self.artist:
+            item.artist = intern_tag(self.artist)
+        if self.album:
+            item.album = intern_tag(self.album)
+        if self.genre:
+            item.genre = intern_tag(self.genre)
+
+class AudioHeaderReader:
+    MP3_BITRATES = {
+        (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+        (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    }
+    MP3_SAMPLE_RATES = {
+        3: [44100, 48000, 32000],
+        2: [22050, 24000, 16000],
+        0: [11025, 12000, 8000],
+    }
+    ID3_TEXT_FRAMES = {
+        'TPE1': 'artist', 'TALB': 'album', 'TCON': 'genre',
+        'TP1': 'artist', 'TAL': 'album', 'TCO': 'genre',
+    }
+    VORBIS_FIELDS = {'ARTIST': 'artist', 'ALBUM': 'album', 'GENRE': 'genre'}
+    MP4_FIELDS = {b'\xa9ART': 'artist', b'\xa9alb': 'album', b'\xa9gen': 'genre'}
+    MP3_SYNC_SEARCH_LIMIT = 64 * 1024
+    OGG_TAIL_SEARCH = 64 * 1024
+    OGG_HEADER_LIMIT = 512 * 1024
+
+    def read(self, path: str) -> Optional[TrackMetadata]:
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < 12:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    metadata = self._read_mapped(mm, size)
+        except (OSError, ValueError, struct.error, IndexError):
+            return None
+        if metadata is None or metadata.duration <= 0:
+            return None
+        return metadata
+
+    def _read_mapped(self, mm, size: int) -> Optional[TrackMetadata]:
+        offset = 0
+        tags = {}
+        if mm[:3] == b'ID3':
+            offset = self._parse_id3v2(mm, tags)
+        magic = mm[offset:offset + 4]
+        if magic == b'fLaC':
+            metadata = self._parse_flac(mm, offset, size)
+        elif magic == b'OggS':
+            metadata = self._parse_ogg(mm, size)
+        elif magic == b'RIFF' and mm[offset + 8:offset + 12] == b'WAVE':
+            metadata = self._parse_wav(mm, size)
+        elif mm[offset + 4:offset + 8] == b'ftyp':
+            metadata = self._parse_mp4(mm, size)
+        else:
+            metadata = self._parse_mp3(mm, offset, size)
+        if metadata is not None:
+            metadata.artist = metadata.artist or tags.get('artist', '')
+            metadata.album = metadata.album or tags.get('album', '')
+            metadata.genre = metadata.genre or tags.get('genre', '')
+        return metadata
+
+    def _parse_id3v2(self, mm, tags: Dict[str, str]) -> int:
+        major = mm[3]
+        flags = mm[5]
+        tag_size = self._syncsafe(mm[6:10])
+        end = 10 + tag_size + (10 if flags & 0x10 else 0)
+        pos = 10
+        if major >= 3 and flags & 0x40:
+            ext_size = struct.unpack('>I', mm[pos:pos + 4])[0]
+            pos += self._syncsafe(mm[pos:pos + 4]) if major == 4 else ext_size + 4
+        header_size = 6 if major == 2 else 10
+        while pos + header_size <= 10 + tag_size:
+            if major == 2:
+                frame_id = mm[pos:pos + 3]
+                frame_size = int.from_bytes(mm[pos + 3:pos + 6], 'big')
+            else:
+                frame_id = mm[pos:pos + 4]
+                raw_size = mm[pos + 4:pos + 8]
+                frame_size = self._syncsafe(raw_size) if major == 4 else struct.unpack('>I', raw_size)[0]
+            if not frame_id.strip(b'\x00') or frame_size <= 0:
+                break
+            field = self.ID3_TEXT_FRAMES.get(frame_id.decode('latin-1'))
+            if field and field not in tags:
+                tags[field] = self._decode_id3_text(mm[pos + header_size:pos + header_size + frame_size])
+            pos += header_size + frame_size
+        return end
+
+    def _decode_id3_text(self, data: bytes) -> str:
+        if not data:
+            return ""
+        encoding = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be', 3: 'utf-8'}.get(data[0], 'latin-1')
+        text = data[1:].decode(encoding, errors='replace')
+        return text.split('\x00')[0].strip()
+
+    def _parse_flac(self, mm, offset: int, size: int) -> Optional[TrackMetadata]:
+        metadata = TrackMetadata(codec="FLAC")
+        pos = offset + 4
+        sample_rate = total_samples = 0
+        while pos + 4 <= size:
+            header = mm[pos]
+            block_type = header & 0x7F
+            length = int.from_bytes(mm[pos + 1:pos + 4], 'big')
+            block = pos + 4
+            if block_type == 0:
+                packed = int.from_bytes(mm[block + 10:block + 18], 'big')
+                sample_rate = packed >> 44
+                total_samples = packed & 0xFFFFFFFFF
+            elif block_type == 4:
+                self._apply_vorbis_comments(mm[block:block + length], metadata)
+            pos = block + length
+            if header & 0x80:
+                break
+        if sample_rate <= 0 or total_samples <= 0:
+            return None
+        seconds = total_samples / sample_rate
+        metadata.duration = int(round(seconds))
+        metadata.bitrate = int((size - pos) * 8 / seconds / 1000) if seconds > 0 else 0
+        return metadata
+
+    def _apply_vorbis_comments(self, data: bytes, metadata: TrackMetadata):
+        try:
+            vendor_length = struct.unpack_from('<I', data, 0)[0]
+            pos = 4 + vendor_length
+            count = struct.unpack_from('<I', data, pos)[0]
+            pos += 4
+            for _ in range(count):
+                length = struct.unpack_from('<I', data, pos)[0]
+                pos += 4
+                comment = bytes(data[pos:pos + length]).decode('utf-8', errors='replace')
+                pos += length
+                key, _, value = comment.partition('=')
+                field = self.VORBIS_FIELDS.get(key.upper())
+                if field and not getattr(metadata, field, ""):
+                    setattr(metadata, field, value.strip())
+        except struct.error:
+            pass
+
+    def _parse_mp3(self, mm, offset: int, size: int) -> Optional[TrackMetadata]:
+        limit = min(size - 4, offset + self.MP3_SYNC_SEARCH_LIMIT)
+        pos = offset
+        while pos < limit:
+            pos = mm.find(b'\xff', pos, limit)
+            if pos < 0:
+                return None
+            frame = self._parse_mp3_frame_header(mm[pos:pos + 4])
+            if frame is not None:
+                next_pos = pos + frame['length']
+                if next_pos + 4 > size or self._parse_mp3_frame_header(mm[next_pos:next_pos + 4]) is not None:
+                    break
+            pos += 1
+        else:
+            return None
+        metadata = TrackMetadata(codec=f"MPEG-{frame['version_name']} Layer {frame['layer']}")
+        audio_bytes = size - pos - (128 if mm[size - 128:size - 125] == b'TAG' else 0)
+        frames = 0
+        mono = frame['channel_mode'] == 3
+        if frame['version'] == 3:
+            side_info = 17 if mono else 32
+        else:
+            side_info = 9 if mono else 17
+        xing = pos + 4 + side_info
+        if mm[xing:xing + 4] in (b'Xing', b'Info'):
+            flags = struct.unpack('>I', mm[xing + 4:xing + 8])[0]
+            if flags & 0x1:
+                frames = struct.unpack('>I', mm[xing + 8:xing + 12])[0]
+            if flags & 0x2:
+                audio_bytes = struct.unpack('>I', mm[xing + 12:xing + 16])[0] if flags & 0x1 else \
+                    struct.unpack('>I', mm[xing + 8:xing + 12])[0]
+        elif mm[pos + 36:pos + 40] == b'VBRI':
+            audio_bytes = struct.unpack('>I', mm[pos + 46:pos + 50])[0]
+            frames = struct.unpack('>I', mm[pos + 50:pos + 54])[0]
+        if frames > 0:
+            seconds = frames * frame['samples'] / frame['sample_rate']
+            metadata.bitrate = int(audio_bytes * 8 / seconds / 1000) if seconds > 0 else 0
+        else:
+            metadata.bitrate = frame['bitrate']
+            seconds = audio_bytes * 8 / (frame['bitrate'] * 1000)
+        metadata.duration = int(round(seconds))
+        return metadata
+
+    def _parse_mp3_frame_header(self, header: bytes) -> Optional[Dict[str, Any]]:
+        if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+            return None
+        version = (header[1] >> 3) & 0x3
+        layer_bits = (header[1] >> 1) & 0x3
+        bitrate_index = header[2] >> 4
+        rate_index = (header[2] >> 2) & 0x3
+        if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+            return None
+        layer = 4 - layer_bits
+        bitrate = self.MP3_BITRATES[(1 if version == 3 else 2, layer)][bitrate_index]
+        sample_rate = self.MP3_SAMPLE_RATES[version][rate_index]
+        padding = (header[2] >> 1) & 0x1
+        if layer == 1:
+            samples = 384
+            length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+        elif layer == 3 and version != 3:
+            samples = 576
+            length = 72 * bitrate * 1000 // sample_rate + padding
+        else:
+            samples = 1152
+            length = 144 * bitrate * 1000 // sample_rate + padding
+        return {
+            'version': version,
+            'version_name': {3: '1', 2: '2', 0: '2.5'}[version],
+            'layer': layer,
+            'bitrate': bitrate,
+            'sample_rate': sample_rate,
+            'samples': samples,
+            'length': length,
+            'channel_mode': header[3] >> 6,
+        }
+
+    def _parse_wav(self, mm, size: int) -> Optional[TrackMetadata]:
+        metadata = TrackMetadata(codec="WAV")
+        byte_rate = 0
+        data_size = 0
+        pos = 12
+        while pos + 8 <= size:
+            chunk_id = mm[pos:pos + 4]
+            chunk_size = struct.unpack('<I', mm[pos + 4:pos + 8])[0]
+            body = pos + 8
+            if chunk_id == b'fmt ':
+                audio_format, channels, sample_rate, byte_rate = struct.unpack('<HHII', mm[body:body + 12])
+                if audio_format != 1:
+                    metadata.codec = f"WAV (format 0x{audio_format:04x})"
+            elif chunk_id == b'data':
+                data_size = min(chunk_size, size - body)
+            elif chunk_id == b'LIST' and mm[body:body + 4] == b'INFO':
+                self._parse_riff_info(mm, body + 4, body + chunk_size, metadata)
+            pos = body + chunk_size + (chunk_size & 1)
+        if byte_rate <= 0 or data_size <= 0:
+            return None
+        metadata.duration = int(round(data_size / byte_rate))
+        metadata.bitrate = byte_rate * 8 // 1000
+        return metadata
+
+    def _parse_riff_info(self, mm, pos: int, end: int, metadata: TrackMetadata):
+        fields = {b'IART': 'artist', b'IPRD': 'album', b'IGNR': 'genre'}
+        while pos + 8 <= end:
+            sub_id = mm[pos:pos + 4]
+            sub_size = struct.unpack('<I', mm[pos + 4:pos + 8])[0]
+            field = fields.get(sub_id)
+            if field:
+                value = mm[pos + 8:pos + 8 + sub_size].split(b'\x00')[0]
+                setattr(metadata, field, value.decode('utf-8', errors='replace').strip())
+            pos += 8 + sub_size + (sub_size & 1)
+
+    def _iter_ogg_packets(self, mm, size: int):
+        pos = 0
+        packet = bytearray()
+        limit = min(size, self.OGG_HEADER_LIMIT)
+        while pos + 27 <= limit and mm[pos:pos + 4] == b'OggS':
+            segments = mm[pos + 26]
+            lacing = mm[pos + 27:pos + 27 + segments]
+            data = pos + 27 + segments
+            for lace in lacing:
+                packet += mm[data:data + lace]
+                data += lace
+                if lace < 255:
+                    yield bytes(packet)
+                    packet = bytearray()
+            pos = data
+        if packet:
+            yield bytes(packet)
+
+    def _parse_ogg(self, mm, size: int) -> Optional[TrackMetadata]:
+        packets = self._iter_ogg_packets(mm, size)
+        first = next(packets, b'')
+        if first.startswith(b'\x01vorbis'):
+            metadata = TrackMetadata(codec="Vorbis")
+            sample_rate = struct.unpack_from('<I', first, 12)[0]
+            nominal = struct.unpack_from('<i', first, 20)[0]
+            pre_skip = 0
+            comment_magic = b'\x03vorbis'
+        elif first.startswith(b'OpusHead'):
+            metadata = TrackMetadata(codec="Opus")
+            sample_rate = 48000
+            nominal = 0
+            pre_skip = struct.unpack_from('<H', first, 10)[0]
+            comment_magic = b'OpusTags'
+        else:
+            return None
+        second = next(packets, b'')
+        if second.startswith(comment_magic):
+            self._apply_vorbis_comments(memoryview(second)[len(comment_magic):], metadata)
+        tail = mm.rfind(b'OggS', max(0, size - self.OGG_TAIL_SEARCH))
+        if tail < 0 or sample_rate <= 0:
+            return None
+        granule = struct.unpack('<q', mm[tail + 6:tail + 14])[0]
+        seconds = (granule - pre_skip) / sample_rate
+        if seconds <= 0:
+            return None
+        metadata.duration = int(round(seconds))
+        metadata.bitrate = nominal // 1000 if nominal > 0 else int(size * 8 / seconds / 1000)
+        return metadata
+
+    def _iter_mp4_atoms(self, mm, start: int, end: int):
+        pos = start
+        while pos + 8 <= end:
+            atom_size = struct.unpack('>I', mm[pos:pos + 4])[0]
+            atom_type = mm[pos + 4:pos + 8]
+            header = 8
+            if atom_size == 1:
+                atom_size = struct.unpack('>Q', mm[pos + 8:pos + 16])[0]
+                header = 16
+            elif atom_size == 0:
+                atom_size = end - pos
+            if atom_size < header:
+                return
+            yield atom_type, pos + header, min(pos + atom_size, end)
+            pos += atom_size
+
+    def _find_mp4_atom(self, mm, start: int, end: int, path: List[bytes]):
+        for atom_type, body, atom_end in self._iter_mp4_atoms(mm, start, end):
+            if atom_type == path[0]:
+                if atom_type == b'meta':
+                    body += 4
+                if len(path) == 1:
+                    return body, atom_end
+                return self._find_mp4_atom(mm, body, atom_end, path[1:])
+        return None
+
+    def _parse_mp4(self, mm, size: int) -> Optional[TrackMetadata]:
+        moov = self._find_mp4_atom(mm, 0, size, [b'moov'])
+        if moov is None:
+            return None
+        mvhd = self._find_mp4_atom(mm, moov[0], moov[1], [b'mvhd'])
+        if mvhd is None:
+            return None
+        body = mvhd[0]
+        if mm[body] == 1:
+            timescale, duration = struct.unpack('>IQ', mm[body + 20:body + 32])
+        else:
+            timescale, duration = struct.unpack('>II', mm[body + 12:body + 20])
+        if timescale <= 0:
+            return None
+        seconds = duration / timescale
+        metadata = TrackMetadata(codec="MPEG-4 audio", duration=int(round(seconds)))
+        if seconds > 0:
+            metadata.bitrate = int(size * 8 / seconds / 1000)
+        stsd = self._find_mp4_atom(mm, moov[0], moov[1], [b'trak', b'mdia', b'minf', b'stbl', b'stsd'])
+        if stsd is not None:
+            entry_type = mm[stsd[0] + 12:stsd[0] + 16]
+            metadata.codec = {b'mp4a': "AAC", b'alac': "ALAC", b'fLaC': "FLAC", b'Opus': "Opus"}.get(
+                entry_type, metadata.codec)
+        ilst = self._find_mp4_atom(mm, moov[0], moov[1], [b'udta', b'meta', b'ilst'])
+        if ilst is not None:
+            for atom_type, body, atom_end in self._iter_mp4_atoms(mm, ilst[0], ilst[1]):
+                field = self.MP4_FIELDS.get(atom_type)
+                if not field:
+                    continue
+                data = self._find_mp4_atom(mm, body, atom_end, [b'data'])
+                if data is not None:
+                    value = mm[data[0] + 8:data[1]].decode('utf-8', errors='replace').strip()
+                    setattr(metadata, field, value)
+        return metadata
+
+    @staticmethod
+    def _syncsafe(data: bytes) -> int:
+        return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+class MetadataCache:
+    def __init__(self, filepath: str = METADATA_CACHE_FILE):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._conn = None
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            self._conn = sqlite3.connect(filepath, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "path TEXT PRIMARY KEY, mtime INTEGER NOT NULL, size INTEGER NOT NULL, "
+                "duration INTEGER, artist TEXT, album TEXT, codec TEXT, bitrate INTEGER, genre TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS preflight ("
+                "path TEXT PRIMARY KEY, mtime INTEGER NOT NULL, size INTEGER NOT NULL, playable INTEGER NOT NULL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(metadata)")}
+            if 'genre' not in columns:
+                self._conn.execute("ALTER TABLE metadata ADD COLUMN genre TEXT")
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn = None
+
+    def get(self, path: str, mtime: int, size: int) -> Optional[TrackMetadata]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT duration, artist, album, codec, bitrate, genre FROM metadata "
+                    "WHERE path = ? AND mtime = ? AND size = ?",
+                    (path, mtime, size)
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None:
+            return None
+        return TrackMetadata(row[0] or 0, row[1] or "", row[2] or "", row[3] or "", row[4] or 0, row[5] or "")
+
+    def put(self, path: str, mtime: int, size: int, metadata: TrackMetadata):
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO metadata "
+                    "(path, mtime, size, duration, artist, album, codec, bitrate, genre) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, mtime, size, metadata.duration, metadata.artist,
+                     metadata.album, metadata.codec, metadata.bitrate, metadata.genre)
+                )
+            except sqlite3.Error:
+                pass
+
+    def get_verdict(self, path: str, mtime: int, size: int) -> Optional[bool]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT playable FROM preflight WHERE path = ? AND mtime = ? AND size = ?",
+                    (path, mtime, size)
+                ).fetchone()
+            except sqlite3.Error:
+                return None
+        return None if row is None else bool(row[0])
+
+    def put_verdict(self, path: str, mtime: int, size: int, playable: bool):
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO preflight (path, mtime, size, playable) VALUES (?, ?, ?, ?)",
+                    (path, mtime, size, int(playable))
+                )
+            except sqlite3.Error:
+                pass
+
+    def commit(self):
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.commit()
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+class MetadataProber:
+    def __init__(self, on_results, cache: MetadataCache = None, max_workers: int = None, on_failed=None):
+        self.on_results = on_results
+        self.on_failed = on_failed
+        self.cache = cache if cache is not None else MetadataCache()
+        self.max_workers = max_workers or min(4, os.cpu_count() or 2)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="linamp-meta")
+        self._local = threading.local()
+        self.header_reader = AudioHeaderReader()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._futures = {}
+        self._results = []
+        self._flush_scheduled = False
+        self._closed = False
+
+    def request(self, items: List[PlaylistItem]):
+        if self._closed:
+            return
+        new_paths = []
+        with self._lock:
+            for item in items:
+                waiting = self._pending.get(item.path)
+                if waiting is None:
+                    self._pending[item.path] = [item]
+                    new_paths.append(item.path)
+                else:
+                    waiting.append(item)
+            for path in new_paths:
+                try:
+                    self._futures[path] = self._pool.submit(self._probe_path, path)
+                except RuntimeError:
+                    break
+
+    def cancel(self, items: List[PlaylistItem]):
+        with self._lock:
+            for item in items:
+                path = item.path
+                waiting = self._pending.get(path)
+                if waiting is None:
+                    continue
+                for index, waiting_item in enumerate(waiting):
+                    if waiting_item == item:
+                        del waiting[index]
+                        break
+                if not waiting:
+                    future = self._futures.get(path)
+                    if future is not None and future.cancel():
+                        del self._futures[path]
+                        del self._pending[path]
+
+    def shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.cache.close()
+
+    def _probe_path(self, path: str):
+        with self._lock:
+            self._futures.pop(path, None)
+        if self._closed:
+            return
+        metadata = None
+        try:
+            st = file_probe.stat(path)
+            if st is not None:
+                mtime, size = int(st.st_mtime), st.st_size
+                metadata = self.cache.get(path, mtime, size)
+                if metadata is None:
+                    metadata = self.probe(path)
+                    if metadata is not None:
+                        self.cache.put(path, mtime, size, metadata)
+                if metadata is not None:
+                    metadata.size = size
+        except (OSError, TimeoutError):
+            pass
+        with self._lock:
+            self._results.append((path, metadata))
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                GLib.timeout_add(METADATA_FLUSH_INTERVAL, self._flush_results)
+
+    def probe(self, path: str) -> Optional[TrackMetadata]:
+        metadata = self.header_reader.read(path)
+        if metadata is not None:
+            return metadata
+        return self.discover(path)
+
+    def discover(self, path: str) -> Optional[TrackMetadata]:
+        if GstPbutils is None:
+            return None
+        discoverer = getattr(self._local, 'discoverer', None)
+        if discoverer is None:
+            try:
+                discoverer = GstPbutils.Discoverer.new(METADATA_PROBE_TIMEOUT * Gst.SECOND)
+            except Exception:
+                return None
+            self._local.discoverer = discoverer
+        try:
+            info = discoverer.discover_uri(Gst.filename_to_uri(path))
+        except Exception:
+            return None
+        metadata = TrackMetadata()
+        duration = info.get_duration()
+        if duration and duration != Gst.CLOCK_TIME_NONE:
+            metadata.duration = int(duration // Gst.SECOND)
+        tags = info.get_tags()
+        if tags is not None:
+            found, artist = tags.get_string(Gst.TAG_ARTIST)
+            if found:
+                metadata.artist = artist
+            found, album = tags.get_string(Gst.TAG_ALBUM)
+            if found:
+                metadata.album = album
+            found, genre = tags.get_string(Gst.TAG_GENRE)
+            if found:
+                metadata.genre = genre
+        audio_streams = info.get_audio_streams()
+        if audio_streams:
+            stream = audio_streams[0]
+            metadata.bitrate = stream.get_bitrate() // 1000
+            caps = stream.get_caps()
+            if caps is not None:
+                try:
+                    metadata.codec = GstPbutils.pb_utils_get_codec_description(caps)
+                except Exception:
+                    metadata.codec = caps.get_structure(0).get_name()
+        return metadata
+
+    def _flush_results(self):
+        with self._lock:
+            results = self._results
+            self._results = []
+            self._flush_scheduled = False
+            resolved = {}
+            failed = []
+            for path, metadata in results:
+                items = self._pending.pop(path, [])
+                if metadata is not None:
+                    resolved[path] = (metadata, items)
+                else:
+                    failed.extend(items)
+        self.cache.commit()
+        if failed and self.on_failed is not None and not self._closed:
+            try:
+                self.on_failed(failed)
+            except Exception:
+                pass
+        if resolved and not self._closed:
+            for metadata, items in resolved.values():
+                for item in items:
+                    metadata.apply_to(item)
+            try:
+                self.on_results(resolved)
+            except Exception:
+                pass
+        return False
+
+@dataclass
+class SmartRule:
+    field: str
+    op: str
+    value: Any
+
+    TEXT_FIELDS = ('title', 'artist', 'album', 'genre', 'path')
+    NUMBER_FIELDS = ('duration', 'play_count', 'last_played_age')
+    FIELD_ALIASES = {'plays': 'play_count', 'length': 'duration', 'name': 'title', 'file': 'path'}
+    UNIT_SECONDS = {
+        's': 1, 'sec': 1, 'secs': 1, 'second': 1, 'seconds': 1,
+        'm': 60, 'min': 60, 'mins': 60, 'minute': 60, 'minutes': 60,
+        'h': 3600, 'hour': 3600, 'hours': 3600,
+        'd': 86400, 'day': 86400, 'days': 86400,
+        'w': 604800, 'week': 604800, 'weeks': 604800,
+    }
+
+    @classmethod
+    def parse(cls, text: str) -> 'SmartRule':
+        text = text.strip()
+        played = re.match(r'^(not\s+)?played\s+in\s+(?:the\s+)?(?:last\s+)?(\d+)\s*([a-z]+)$', text, re.I)
+        if played:
+            seconds = int(played.group(2)) * cls.UNIT_SECONDS.get(played.group(3).lower(), 86400)
+            return cls('last_played_age', '>=' if played.group(1) else '<', seconds)
+        clause = re.match(r'^(\w+)\s*(==|!=|>=|<=|=|>|<|~|:|contains|is not|is)\s*(.+)$', text, re.I)
+        if not clause:
+            raise ValueError(f"Cannot parse rule: {text}")
+        field = clause.group(1).lower()
+        field = cls.FIELD_ALIASES.get(field, field)
+        op = {'==': '=', 'is': '=', 'is not': '!=', '~': 'contains', ':': 'contains'}.get(clause.group(2).lower(), clause.group(2).lower())
+        raw = clause.group(3).strip().strip('"\'')
+        if field in cls.TEXT_FIELDS:
+            return cls(field, op, raw.casefold())
+        if field in cls.NUMBER_FIELDS:
+            number = re.match(r'^(\d+(?:\.\d+)?)\s*([a-z]*)$', raw, re.I)
+            if not number:
+                raise ValueError(f"Expected a number in rule: {text}")
+            value = float(number.group(1))
+            if field != 'play_count':
+                value *= cls.UNIT_SECONDS.get(number.group(2).lower(), 1)
+            return cls(field, op, value)
+        raise ValueError(f"Unknown field in rule: {field}")
+
+    def evaluate(self, item: PlaylistItem, now: float) -> Tuple[bool, Optional[float]]:
+        if self.field == 'last_played_age':
+            if item.last_played <= 0:
+                return self._compare(float('inf')), None
+            age = now - item.last_played
+            matches = self._compare(age)
+            due = item.last_played + self.value
+            return matches, due if due > now else None
+        if self.field in self.TEXT_FIELDS:
+            actual = (getattr(item, self.field, "") or "").casefold()
+            if self.op == 'contains':
+                return self.value in actual, None
+            if self.op == '!=':
+                return actual != self.value, None
+            if self.op == '=':
+                return actual == self.value, None
+            return self._compare(actual), None
+        return self._compare(getattr(item, self.field, 0) or 0), None
+
+    def _compare(self, actual) -> bool:
+        if self.op == '=':
+            return actual == self.value
+        if self.op == '!=':
+            return actual != self.value
+        if self.op == '>':
+            return actual > self.value
+        if self.op == '<':
+            return actual < self.value
+        if self.op == '>=':
+            return actual >= self.value
+        if self.op == '<=':
+            return actual <= self.value
+        return False
+
+class SmartPlaylist:
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query = query
+        self.rules = [SmartRule.parse(part) for part in self.split_query(query)]
+        self.members = set()
+        self._due = {}
+        self._timers = []
+        self._sequence = 0
+
+    @staticmethod
+    def split_query(query: str) -> List[str]:
+        parts = ['']
+        for index, segment in enumerate(re.split(r'("[^"]*"|\'[^\']*\')', query)):
+            if index % 2:
+                parts[-1] += segment
+                continue
+            pieces = re.split(r'\s+and\s+', segment, flags=re.I)
+            parts[-1] += pieces[0]
+            parts.extend(pieces[1:])
+        return [part.strip() for part in parts if part.strip()]
+
+    def reset(self):
+        self.members.clear()
+        self._due.clear()
+        self._timers.clear()
+
+    def _set_due(self, item: PlaylistItem, due: Optional[float]):
+        key = item.id
+        entry = self._due.get(key)
+        if due is None:
+            if entry is not None:
+                del self._due[key]
+                self._compact_timers()
+            return
+        if entry is not None and entry[0] == due:
+            return
+        self._sequence += 1
+        entry = self._due[key] = (due, self._sequence, item)
+        heapq.heappush(self._timers, entry)
+        self._compact_timers()
+
+    def _compact_timers(self):
+        if len(self._timers) > 2 * len(self._due) + 64:
+            self._timers = list(self._due.values())
+            heapq.heapify(self._timers)
+
+    def update(self, items: List[PlaylistItem], now: float = None) -> bool:
+        now = time.time() if now is None else now
+        changed = False
+        for item in items:
+            matches = True
+            due = None
+            for rule in self.rules:
+                rule_matches, rule_due = rule.evaluate(item, now)
+                matches = matches and rule_matches
+                if rule_due is not None and (due is None or rule_due < due):
+                    due = rule_due
+            key = item.id
+            if matches and key not in self.members:
+                self.members.add(key)
+                changed = True
+            elif not matches and key in self.members:
+                self.members.discard(key)
+                changed = True
+            self._set_due(item, due)
+        return changed
+
+    def discard(self, items: List[PlaylistItem]) -> bool:
+        before = len(self.members)
+        for item in items:
+            self.members.discard(item.id)
+            self._due.pop(item.id, None)
+        self._compact_timers()
+        return len(self.members) != before
+
+    def update_due(self, alive: set, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        due_items = []
+        while self._timers and self._timers[0][0] <= now:
+            entry = heapq.heappop(self._timers)
+            item = entry[2]
+            if self._due.get(item.id) is not entry:
+                continue
+            del self._due[item.id]
+            if item.id in alive:
+                due_items.append(item)
+        return self.update(due_items, now) if due_items else False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'query': self.query}
+
+class SmartPlaylistManager:
+    def __init__(self, filepath: str = SMART_PLAYLISTS_FILE):
+        self.filepath = filepath
+        self.playlists = []
+        self._alive = set()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for entry in data if isinstance(data, list) else []:
+            try:
+                self.playlists.append(SmartPlaylist(entry['name'], entry['query']))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+    def save(self):
+        temp_file = None
+        try:
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(prefix='.smart_', suffix='.tmp',
+                                             dir=os.path.dirname(self.filepath), text=True)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump([playlist.to_dict() for playlist in self.playlists], f, indent=2)
+            os.replace(temp_file, self.filepath)
+            temp_file = None
+        except (OSError, IOError):
+            pass
+        finally:
+            if temp_file and os.path.exists(temp_file):
+                try:
+                    os.unlink(temp_file)
+                except Exception:
+                    pass
+
+    def get(self, name: str) -> Optional[SmartPlaylist]:
+        for playlist in self.playlists:
+            if playlist.name == name:
+                return playlist
+        return None
+
+    def define(self, name: str, query: str, items: List[PlaylistItem]) -> SmartPlaylist:
+        playlist = SmartPlaylist(name, query)
+        playlist.update(items)
+        existing = self.get(name)
+        if existing is not None:
+            self.playlists[self.playlists.index(existing)] = playlist
+        else:
+            self.playlists.append(playlist)
+        self.save()
+        return playlist
+
+    def delete(self, name: str):
+        playlist = self.get(name)
+        if playlist is not None:
+            self.playlists.remove(playlist)
+            self.save()
+
+    def rebuild(self, items: List[PlaylistItem]):
+        self._alive = {item.id for item in items}
+        for playlist in self.playlists:
+            playlist.reset()
+            playlist.update(items)
+
+    def items_added(self, items: List[PlaylistItem]) -> bool:
+        self._alive.update(item.id for item in items)
+        return self.items_changed(items)
+
+    def items_changed(self, items: List[PlaylistItem]) -> bool:
+        changed = False
+        for playlist in self.playlists:
+            changed = playlist.update(items) or changed
+        return changed
+
+    def items_removed(self, items: List[PlaylistItem]) -> bool:
+        self._alive.difference_update(item.id for item in items)
+        changed = False
+        for playlist in self.playlists:
+            changed = playlist.discard(items) or changed
+        return changed
+
+    def update_due(self) -> bool:
+        now = time.time()
+        changed = False
+        for playlist in self.playlists:
+            changed = playlist.update_due(self._alive, now) or changed
+        return changed
+
+class LibraryDatabase:
+    TRACK_COLUMNS = ('id', 'path', 'title', 'artist', 'album', 'genre', 'duration',
+                     'codec', 'bitrate', 'play_count', 'last_played', 'added')
+
+    def __init__(self, filepath: str = LIBRARY_DB_FILE):
+        self.filepath = filepath
+        self.has_fts = False
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="linamp-library")
+        self._conn = None
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            self._conn = sqlite3.connect(filepath, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, title TEXT, artist TEXT, "
+                "album TEXT, genre TEXT, duration INTEGER DEFAULT 0, codec TEXT, bitrate INTEGER DEFAULT 0, "
+                "play_count INTEGER DEFAULT 0, last_played REAL, added REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tracks_artist_album ON tracks (artist, album)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS tracks_artist_album_key ON tracks (IFNULL(artist, ''), IFNULL(album, ''))"
+            )
+            rebuild = self._create_fts()
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn = None
+            return
+        if rebuild:
+            self._submit(self._rebuild_fts)
+
+    def _create_fts(self) -> bool:
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tracks_fts'"
+        ).fetchone() is not None
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5("
+                "title, artist, album, path, content='tracks', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        self._conn.executescript(
+            "CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN "
+            "INSERT INTO tracks_fts (rowid, title, artist, album, path) "
+            "VALUES (new.id, new.title, new.artist, new.album, new.path); END;"
+            "CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN "
+            "INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, album, path) "
+            "VALUES ('delete', old.id, old.title, old.artist, old.album, old.path); END;"
+            "CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF title, artist, album, path ON tracks BEGIN "
+            "INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, album, path) "
+            "VALUES ('delete', old.id, old.title, old.artist, old.album, old.path); "
+            "INSERT INTO tracks_fts (rowid, title, artist, album, path) "
+            "VALUES (new.id, new.title, new.artist, new.album, new.path); END;"
+        )
+        self.has_fts = True
+        return not exists
+
+    def _rebuild_fts(self):
+        self._conn.execute("INSERT INTO tracks_fts (tracks_fts) VALUES ('rebuild')")
+
+    @property
+    def available(self) -> bool:
+        return self._conn is not None
+
+    def _submit(self, func, *args):
+        if self._conn is None:
+            return
+        try:
+            self._writer.submit(self._write, func, *args)
+        except RuntimeError:
+            pass
+
+    def _write(self, func, *args):
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                func(*args)
+                self._conn.commit()
+            except sqlite3.Error:
+                try:
+                    self._conn.rollback()
+                except sqlite3.Error:
+                    pass
+
+    def add_items(self, items: List[PlaylistItem]):
+        rows = [(item.path, item.title, item.artist, item.album, item.duration, time.time()) for item in items]
+        self._submit(self._insert_rows, rows)
+
+    def _insert_rows(self, rows):
+        self._conn.executemany(
+            "INSERT INTO tracks (path, title, artist, album, duration, added) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET title = excluded.title WHERE title IS NOT excluded.title",
+            rows
+        )
+
+    def remove_paths(self, paths: List[str]):
+        self._submit(self._delete_paths, [(path,) for path in paths])
+
+    def _delete_paths(self, rows):
+        self._conn.executemany("DELETE FROM tracks WHERE path = ?", rows)
+
+    def update_metadata(self, resolved: Dict[str, TrackMetadata]):
+        rows = [(m.artist, m.album, m.genre, m.duration, m.codec, m.bitrate, path)
+                for path, m in resolved.items()]
+        self._submit(self._update_rows, rows)
+
+    def _update_rows(self, rows):
+        self._conn.executemany(
+            "UPDATE tracks SET artist = ?, album = ?, genre = ?, duration = ?, codec = ?, bitrate = ? "
+            "WHERE path = ?",
+            rows
+        )
+
+    def record_play(self, path: str):
+        self._submit(self._record_play, path, time.time())
+
+    def _record_play(self, path, played_at):
+        self._conn.execute(
+            "UPDATE tracks SET play_count = play_count + 1, last_played = ? WHERE path = ?",
+            (played_at, path)
+        )
+
+    def _match(self, text: str) -> Optional[Tuple[str, List[str]]]:
+        tokens = re.findall(r'\w+', text.casefold())
+        if not tokens:
+            return None
+        if self.has_fts:
+            return ("id IN (SELECT rowid FROM tracks_fts WHERE tracks_fts MATCH ?)",
+                    [' '.join(f'"{token}"*' for token in tokens)])
+        return (" AND ".join("(IFNULL(title, '') || ' ' || IFNULL(artist, '') || ' ' || IFNULL(album, '') || ' ' "
+                             "|| path) LIKE ?" for _ in tokens),
+                [f"%{token}%" for token in tokens])
+
+    def search(self, text: str, limit: int = None) -> Optional[List[str]]:
+        if self._conn is None:
+            return None
+        match = self._match(text)
+        if match is None:
+            return None
+        where, params = match
+        if self.has_fts:
+            sql = ("SELECT t.path FROM tracks_fts JOIN tracks t ON t.id = tracks_fts.rowid "
+                   "WHERE tracks_fts MATCH ? ORDER BY bm25(tracks_fts, 10.0, 8.0, 6.0, 1.0)")
+        else:
+            sql = f"SELECT path FROM tracks WHERE {where} ORDER BY id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            try:
+                return [row[0] for row in self._conn.execute(sql, params)]
+            except sqlite3.Error:
+                return None
+
+    def search_items(self, text: str, limit: int = None) -> List[PlaylistItem]:
+        match = self._match(text)
+        if match is None:
+            return []
+        return self.query_items(match[0], tuple(match[1]),
+                                order_by="IFNULL(artist, '') COLLATE NOCASE, IFNULL(album, '') COLLATE NOCASE, "
+                                         "title COLLATE NOCASE, path",
+                                limit=limit)
+
+    def query(self, where: str = "1", params: Tuple = (), order_by: str = "id",
+              limit: int = None) -> List[Dict[str, Any]]:
+        if self._conn is None:
+            return []
+        sql = f"SELECT {', '.join(self.TRACK_COLUMNS)} FROM tracks WHERE {where} ORDER BY {order_by}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            try:
+                return [dict(zip(self.TRACK_COLUMNS, row)) for row in self._conn.execute(sql, params)]
+            except sqlite3.Error:
+                return []
+
+    def query_items(self, where: str = "1", params: Tuple = (), order_by: str = "id",
+                    limit: int = None) -> List[PlaylistItem]:
+        return [
+            PlaylistItem(path=row['path'], title=row['title'] or "", duration=row['duration'] or 0,
+                         artist=row['artist'] or "", album=row['album'] or "")
+            for row in self.query(where, params, order_by, limit)
+        ]
+
+    def artist_album_index(self) -> List[Tuple[str, List[Tuple[str, int]]]]:
+        if self._conn is None:
+            return []
+        index = []
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    "SELECT IFNULL(artist, ''), IFNULL(album, ''), COUNT(*) FROM tracks "
+                    "GROUP BY IFNULL(artist, ''), IFNULL(album, '')"
+                ).fetchall()
+            except sqlite3.Error:
+                return []
+        rows.sort(key=lambda row: (row[0].casefold(), row[0], row[1].casefold(), row[1]))
+        for artist, album, count in rows:
+            if not index or index[-1][0] != artist:
+                index.append((artist, []))
+            index[-1][1].append((album, count))
+        return index
+
+    def album_tracks(self, artist: str, album: str) -> List[PlaylistItem]:
+        return self.query_items("IFNULL(artist, '') = ? AND IFNULL(album, '') = ?", (artist, album),
+                                order_by="title COLLATE NOCASE, path")
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.commit()
+                    self._conn.close()
+                except sqlite3.Error:
+                    pass
+                self._conn = None
+
+class PreflightValidator:
+    def __init__(self, on_results, cache: MetadataCache, on_sizes=None):
+        self.on_results = on_results
+        self.on_sizes = on_sizes
+        self.cache = cache
+        self._queue = deque()
+        self._urgent = deque()
+        self._queued = set()
+        self._pending = {}
+        self._results = []
+        self._condition = threading.Condition()
+        self._flush_scheduled = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="linamp-preflight", daemon=True)
+        self._thread.start()
+
+    def request(self, items: List[PlaylistItem], urgent: bool = False):
+        with self._condition:
+            if self._closed:
+                return
+            for item in items:
+                waiting = self._pending.get(item.path)
+                if waiting is None:
+                    self._pending[item.path] = [item]
+                    self._queued.add(item.path)
+                    if urgent:
+                        self._urgent.appendleft(item.path)
+                    else:
+                        self._queue.append(item.path)
+                else:
+                    waiting.append(item)
+                    if urgent and item.path in self._queued:
+                        self._urgent.appendleft(item.path)
+            self._condition.notify()
+
+    def record_failure(self, item: PlaylistItem):
+        item.playable = False
+        with self._condition:
+            if self._closed:
+                return
+            self._pending.setdefault(item.path, []).append(item)
+            self._urgent.appendleft(("failed", item.path))
+            self._condition.notify()
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            self._queue.clear()
+            self._urgent.clear()
+            self._queued.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._urgent and not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                entry = self._urgent.popleft() if self._urgent else self._queue.popleft()
+                if not isinstance(entry, tuple):
+                    if entry not in self._queued:
+                        continue
+                    self._queued.discard(entry)
+            if isinstance(entry, tuple):
+                path, known = entry[1], False
+            else:
+                path, known = entry, None
+            verdict = None
+            size = None
+            try:
+                st = file_probe.stat(path)
+                if st is None:
+                    verdict = False
+                else:
+                    mtime, size = int(st.st_mtime), st.st_size
+                    if known is not None:
+                        verdict = known
+                    else:
+                        verdict = self.cache.get_verdict(path, mtime, size)
+                        if verdict is None:
+                            verdict = self.preroll(path)
+                            time.sleep(PREFLIGHT_IDLE_DELAY)
+                    if verdict is not None:
+                        self.cache.put_verdict(path, mtime, size, verdict)
+            except (OSError, TimeoutError):
+                verdict = None
+            with self._condition:
+                self._results.append((path, verdict, size))
+                if not self._flush_scheduled:
+                    self._flush_scheduled = True
+                    GLib.timeout_add(PREFLIGHT_FLUSH_INTERVAL, self._flush_results)
+
+    def preroll(self, path: str) -> Optional[bool]:
+        pipeline = Gst.ElementFactory.make("playbin", None)
+        if pipeline is None:
+            return None
+        try:
+            pipeline.set_property("audio-sink", Gst.ElementFactory.make("fakesink", None))
+            pipeline.set_property("video-sink", Gst.ElementFactory.make("fakesink", None))
+            pipeline.set_property("uri", Gst.filename_to_uri(path))
+            if pipeline.set_state(Gst.State.PAUSED) == Gst.StateChangeReturn.FAILURE:
+                return False
+            message = pipeline.get_bus().timed_pop_filtered(
+                PREFLIGHT_TIMEOUT * Gst.SECOND,
+                Gst.MessageType.ASYNC_DONE | Gst.MessageType.ERROR
+            )
+            if message is None:
+                return None
+            return message.type == Gst.MessageType.ASYNC_DONE
+        except Exception:
+            return None
+        finally:
+            pipeline.set_state(Gst.State.NULL)
+
+    def _flush_results(self):
+        changed = []
+        with self._condition:
+            results = self._results
+            self._results = []
+            self._flush_scheduled = False
+            for path, verdict, size in results:
+                for item in self._pending.pop(path, []):
+                    if verdict is not None and item.playable != verdict:
+                        item.playable = verdict
+                        changed.append(item)
+        self.cache.commit()
+        if self._closed:
+            return False
+        sizes = [(path, size) for path, verdict, size in results if size is not None]
+        if sizes and self.on_sizes is not None:
+            try:
+                self.on_sizes(sizes)
+            except Exception:
+                pass
+        if changed:
+            try:
+                self.on_results(changed)
+            except Exception:
+                pass
+        return False
+
+class LibraryScanner:
+    def __init__(self, on_batch, on_progress=None, on_finished=None,
+                 max_workers: int = None, batch_size: int = SCAN_BATCH_SIZE,
+                 is_known=None):
+        self.on_batch = on_batch
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.is_known = is_known or (lambda path: False)
+        self.folder_roots = []
+        self.directories = []
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 2) * 2)
+        self.batch_size = batch_size
+        self.dirs_scanned = 0
+        self.files_found = 0
+        self._cancel_event = threading.Event()
+        self._pending_batches = threading.BoundedSemaphore(SCAN_MAX_PENDING_BATCHES)
+        self._thread = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, paths: Union[str, List[str]], title_root: str = None):
+        if isinstance(paths, str):
+            paths = [paths]
+        paths = [os.path.abspath(os.path.expanduser(str(path))) for path in paths if path]
+        title_root = os.path.abspath(title_root) if title_root else None
+        self._thread = threading.Thread(target=self._run, args=(paths, title_root), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def _scan_directory(self, title_root: str, directory: str) -> Tuple[str, List[str], List[PlaylistItem]]:
+        subdirs = []
+        items = []
+        if self.cancelled:
+            return title_root, subdirs, items
+        try:
+            with os.scandir(directory) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif self.is_known(entry.path):
+                            continue
+                        elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS and entry.is_file():
+                            title = os.path.relpath(entry.path, title_root)
+                            items.append(PlaylistItem(path=entry.path, title=title))
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        return title_root, subdirs, items
+
+    def _run(self, paths: List[str], title_root: Optional[str]):
+        buffer = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="linamp-scan") as pool:
+                pending = set()
+                for path in paths:
+                    if self.cancelled:
+                        break
+                    try:
+                        if file_probe.isdir(path):
+                            self.folder_roots.append(path)
+                            self.directories.append(path)
+                            pending.add(pool.submit(self._scan_directory, title_root or path, path))
+                        elif file_probe.isfile(path):
+                            buffer.append(PlaylistItem(path=path, title=os.path.basename(path)))
+                    except OSError:
+                        pass
+                while pending and not self.cancelled:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            base, subdirs, items = future.result()
+                        except Exception:
+                            continue
+                        self.dirs_scanned += 1
+                        if not self.cancelled:
+                            for subdir in subdirs:
+                                self.directories.append(subdir)
+                                pending.add(pool.submit(self._scan_directory, base, subdir))
+                        buffer.extend(items)
+                        while len(buffer) >= self.batch_size and not self.cancelled:
+                            self._deliver(buffer[:self.batch_size])
+                            buffer = buffer[self.batch_size:]
+                for future in pending:
+                    future.cancel()
+            if buffer and not self.cancelled:
+                self._deliver(buffer)
+        finally:
+            GLib.idle_add(self._emit_finished)
+
+    def _deliver(self, items: List[PlaylistItem]):
+        while not self._pending_batches.acquire(timeout=0.1):
+            if self.cancelled:
+                return
+        self.files_found += len(items)
+        GLib.idle_add(self._emit_batch, items, self.dirs_scanned, self.files_found)
+
+    def _emit_batch(self, items, dirs_scanned, files_found):
+        try:
+            if not self.cancelled:
+                self.on_batch(items)
+                if self.on_progress:
+                    self.on_progress(dirs_scanned, files_found)
+        except Exception:
+            pass
+        finally:
+            self._pending_batches.release()
+        return False
+
+    def _emit_finished(self):
+        if self.on_finished:
+            try:
+                self.on_finished(self)
+            except Exception:
+                pass
+        return False
+
+def watch_monitor_limit() -> int:
+    try:
+        with open(INOTIFY_MAX_WATCHES_FILE, 'r') as f:
+            return max(1, int(int(f.read().strip()) * WATCH_MONITOR_SHARE))
+    except (OSError, ValueError):
+        return WATCH_MAX_MONITORS
+
+class FolderWatcher:
+    def __init__(self, on_changes, filepath: str = WATCHED_FOLDERS_FILE, tracks=None):
+        self.on_changes = on_changes
+        self.filepath = filepath
+        self.tracks = tracks
+        self.roots = {}
+        self._monitors = {}
+        self._checked = {}
+        self._monitor_limit = watch_monitor_limit()
+        self._polled = set()
+        self._rescanning = set()
+        self._rescan_source = None
+        self._pending_added = set()
+        self._pending_removed = set()
+        self._pending_changed = set()
+        self._flush_source = None
+
+    def restore(self):
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        roots = data.get('roots', {}) if isinstance(data, dict) else {}
+        checked = data.get('checked', {}) if isinstance(data, dict) else {}
+        try:
+            saved_at = os.path.getmtime(self.filepath)
+        except OSError:
+            saved_at = 0.0
+        for root, directories in roots.items():
+            if file_probe.isdir(root) is not False:
+                self.roots[root] = set(directories) | {root}
+                self._checked[root] = checked.get(root, saved_at)
+                self._arm(sorted(self.roots[root]))
+                self.rescan(root)
+
+    def _arm(self, directories: List[str]):
+        for directory in directories:
+            if not self._add_monitor(directory):
+                self._polled.add(directory)
+        if self._polled and self._rescan_source is None:
+            self._rescan_source = GLib.timeout_add_seconds(WATCH_RESCAN_INTERVAL, self._rescan_polled)
+
+    def _rescan_polled(self):
+        by_root = {}
+        for directory in list(self._polled):
+            root = self.root_for(directory)
+            if root is None:
+                self._polled.discard(directory)
+            else:
+                by_root.setdefault(root, []).append(directory)
+        for root, directories in by_root.items():
+            self.rescan(root, directories)
+        if self._polled:
+            return True
+        self._rescan_source = None
+        return False
+
+    def rescan(self, root: str, directories: List[str] = None):
+        if self.tracks is None or root in self._rescanning:
+            return
+        self._rescanning.add(root)
+        known_dirs = frozenset(self.roots[root])
+        tracks = TrackList(self.tracks())
+        threading.Thread(target=self._rescan, name="linamp-rescan", daemon=True,
+                         args=(root, tracks, known_dirs, known_dirs if directories is None else frozenset(directories),
+                               self._checked.get(root, 0.0))).start()
+
+    @staticmethod
+    def _list_directory(directory: str, known: set, since: float):
+        subdirs = []
+        seen = []
+        added = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.path in known:
+                        seen.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                        st = entry.stat()
+                        if max(st.st_mtime, st.st_ctime) >= since:
+                            added.append(entry.path)
+                except OSError:
+                    pass
+        return subdirs, seen, added
+
+    def _rescan(self, root: str, tracks, known_dirs, directories, since: float):
+        started = time.time()
+        complete = False
+        gone = []
+        new_dirs = []
+        added = []
+        removed = []
+        try:
+            wanted = {}
+            for directory in directories:
+                folder = track_store.find_folder(directory.rstrip('/') + '/')
+                if folder is not None:
+                    wanted[folder] = directory
+            known = {}
+            folders = track_store.folder
+            for row in tracks.ids:
+                directory = wanted.get(folders[row])
+                if directory is not None:
+                    known.setdefault(directory, set()).add(PlaylistItem.view(row).path)
+            for directory in sorted(directories):
+                try:
+                    st = file_probe.call(directory, os.stat, directory)
+                except (FileNotFoundError, NotADirectoryError):
+                    if directory == root:
+                        return
+                    gone.append(directory)
+                    continue
+                except TimeoutError:
+                    return
+                except OSError:
+                    continue
+                if max(st.st_mtime, st.st_ctime) < since:
+                    continue
+                paths = known.get(directory, set())
+                try:
+                    subdirs, seen, found = file_probe.call(directory, self._list_directory, directory, paths, since)
+                except TimeoutError:
+                    return
+                except OSError:
+                    continue
+                if directory == root and not (subdirs or seen or found):
+                    continue
+                new_dirs.extend(subdir for subdir in subdirs if subdir not in known_dirs)
+                added.extend(found)
+                removed.extend(paths.difference(seen))
+            removed.extend(gone)
+            complete = True
+        except Exception:
+            pass
+        finally:
+            if not complete:
+                gone, new_dirs, added, removed = [], [], [], []
+            GLib.idle_add(self._finish_rescan, root, complete, gone, sorted(new_dirs),
+                          sorted(added), sorted(removed), started)
+
+    def _finish_rescan(self, root: str, complete: bool, gone, new_dirs, added, removed, started: float):
+        self._rescanning.discard(root)
+        if root not in self.roots or not complete:
+            return False
+        self._checked[root] = started
+        for directory in gone:
+            self._remove_monitors(directory)
+        self.save()
+        if added or new_dirs or removed:
+            try:
+                self.on_changes(added, new_dirs, removed, [])
+            except Exception:
+                pass
+        return False
+
+    def is_watched(self, path: str) -> bool:
+        return self.root_for(path) is not None
+
+    def root_for(self, path: str) -> Optional[str]:
+        for root in self.roots:
+            if path == root or path.startswith(root + os.sep):
+                return root
+        return None
+
+    def watch(self, root: str, directories: List[str]):
+        root = os.path.abspath(root)
+        parent = self.root_for(root)
+        if parent is not None:
+            root_dirs = self.roots[parent]
+        else:
+            root_dirs = {root}
+            for other in [r for r in self.roots if r.startswith(root + os.sep)]:
+                root_dirs |= self.roots.pop(other)
+                self._checked.pop(other, None)
+            self.roots[root] = root_dirs
+            self._checked[root] = time.time()
+        root_dirs.update(directories)
+        self._arm([root] + list(directories))
+        self.save()
+
+    def clear(self):
+        for monitor in self._monitors.values():
+            try:
+                monitor.cancel()
+            except Exception:
+                pass
+        self._monitors.clear()
+        self.roots.clear()
+        self._checked.clear()
+        self._polled.clear()
+        if self._rescan_source is not None:
+            GLib.source_remove(self._rescan_source)
+            self._rescan_source = None
+        self._pending_added.clear()
+        self._pending_removed.clear()
+        self._pending_changed.clear()
+        self.save()
+
+    def checkpoint(self):
+        now = time.time()
+        polled = {self.root_for(directory) for directory in self._polled}
+        for root in self.roots:
+            if root not in polled:
+                self._checked[root] = now
+        self.save()
+
+    def save(self):
+        data = {'roots': {root: sorted(dirs) for root, dirs in self.roots.items()},
+                'checked': {root: self._checked.get(root, 0.0) for root in self.roots}}
+        temp_file = None
+        try:
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(prefix='.watched_', suffix='.tmp',
+                                             dir=os.path.dirname(self.filepath), text=True)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_file, self.filepath)
+            temp_file = None
+        except (OSError, IOError):
+            pass
+        finally:
+            if temp_file and os.path.exists(temp_file):
+                try:
+                    os.unlink(temp_file)
+                except Exception:
+                    pass
+
+    def _add_monitor(self, directory: str) -> bool:
+        if directory in self._monitors:
+            return True
+        if len(self._monitors) >= self._monitor_limit:
+            return False
+        try:
+            monitor = Gio.File.new_for_path(directory).monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, None
+            )
+            monitor.connect("changed", self._on_monitor_changed)
+            self._monitors[directory] = monitor
+        except Exception:
+            return False
+        return True
+
+    def _remove_monitors(self, directory: str):
+        prefix = directory + os.sep
+        for path in [p for p in self._monitors if p == directory or p.startswith(prefix)]:
+            try:
+                self._monitors.pop(path).cancel()
+            except Exception:
+                pass
+        self._polled.difference_update([p for p in self._polled if p == directory or p.startswith(prefix)])
+        for dirs in self.roots.values():
+            dirs.difference_update([p for p in dirs if p == directory or p.startswith(prefix)])
+
+    def _on_monitor_changed(self, monitor, file, other_file, event_type):
+        path = file.get_path() if file else None
+        if not path:
+            return
+        if event_type in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.MOVED_IN):
+            self._mark_added(path)
+        elif event_type in (Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_OUT):
+            self._mark_removed(path)
+        elif event_type == Gio.FileMonitorEvent.RENAMED:
+            self._mark_removed(path)
+            new_path = other_file.get_path() if other_file else None
+            if new_path:
+                self._mark_added(new_path)
+        elif event_type == Gio.FileMonitorEvent.CHANGES_DONE_HINT:
+            self._pending_changed.add(path)
+        else:
+            return
+        if self._flush_source is None:
+            self._flush_source = GLib.timeout_add(WATCH_DEBOUNCE_INTERVAL, self._flush)
+
+    def _mark_added(self, path: str):
+        self._pending_removed.discard(path)
+        self._pending_added.add(path)
+
+    def _mark_removed(self, path: str):
+        self._pending_added.discard(path)
+        self._pending_removed.add(path)
+        if path in self._monitors:
+            self._remove_monitors(path)
+
+    def _flush(self):
+        self._flush_source = None
+        added_files = []
+        added_dirs = []
+        for path in self._pending_added:
+            if self.root_for(path) is None:
+                continue
+            file_probe.invalidate(path)
+            if file_probe.isdir(path):
+                added_dirs.append(path)
+            elif os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS:
+                added_files.append(path)
+        removed = list(self._pending_removed)
+        for path in removed:
+            file_probe.invalidate(path)
+        changed = list(self._pending_changed - self._pending_added)
+        self._pending_added.clear()
+        self._pending_removed.clear()
+        self._pending_changed.clear()
+        try:
+            self.on_changes(added_files, added_dirs, removed, changed)
+        except Exception:
+            pass
+        return False
+
 class EqualizerTab(Gtk.Box):
     def __init__(self, player):
         super().__init__(orientation=Gtk.Orientation.VERTICAL)
@@ -261,14 +2613,1015 @@ class EqualizerTab(Gtk.Box):
             if hasattr(self.player, 'auto_save_settings'):
                 self.player.auto_save_settings()
 
+def fold_search_text(text: str) -> str:
+    if text.isascii():
+        return text.lower()
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+def natural_sort_key(text: str) -> Tuple:
+    parts = re.split(r'(\d+)', text.casefold().replace('\x00', ''))
+    return tuple(int(part) if i % 2 else locale.strxfrm(part) for i, part in enumerate(parts))
+
+class PlaylistSearchIndex:
+    FIELD_WEIGHTS = (1.0, 0.9, 0.8, 0.6, 0.5)
+
+    def __init__(self):
+        self._postings = {}
+        self._vocabulary = None
+        self._trigrams = {}
+
+    @staticmethod
+    def _trigrams_of(word: str) -> set:
+        return {word[i:i + 3] for i in range(len(word) - 2)}
+
+    def _weights(self, row: 'PlaylistRow') -> Dict[str, float]:
+        item = row.item
+        fields = (item.get_display_name(), item.artist, item.album, item.genre,
+                  os.path.splitext(item.name)[0])
+        weights = {}
+        for text, weight in zip(fields, self.FIELD_WEIGHTS):
+            if not text:
+                continue
+            for word in re.findall(r'\w+', fold_search_text(text)):
+                if weights.get(word, 0) < weight:
+                    weights[word] = weight
+        return weights
+
+    def add(self, row: 'PlaylistRow', weights: Dict[str, float] = None):
+        if weights is None:
+            weights = self._weights(row)
+        for word, weight in weights.items():
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = {}
+                self._vocabulary = None
+                for gram in self._trigrams_of(word):
+                    self._trigrams.setdefault(gram, set()).add(word)
+            posting[row] = weight
+        row.search_words = tuple(weights)
+
+    def update(self, row: 'PlaylistRow') -> bool:
+        words = row.search_words
+        if words is None:
+            return False
+        weights = self._weights(row)
+        if tuple(weights) == words and all(self._postings[word].get(row) == weight
+                                           for word, weight in weights.items()):
+            return False
+        self.remove(row)
+        self.add(row, weights)
+        return True
+
+    def remove(self, row: 'PlaylistRow'):
+        words = row.search_words
+        if words is None:
+            return
+        row.search_words = None
+        for word in words:
+            posting = self._postings.get(word)
+            if posting is None:
+                continue
+            posting.pop(row, None)
+            if posting:
+                continue
+            del self._postings[word]
+            self._vocabulary = None
+            for gram in self._trigrams_of(word):
+                words_with_gram = self._trigrams.get(gram)
+                if words_with_gram is not None:
+                    words_with_gram.discard(word)
+                    if not words_with_gram:
+                        del self._trigrams[gram]
+
+    @staticmethod
+    def _prefix_distance(token: str, word: str) -> int:
+        before = None
+        previous = list(range(len(word) + 1))
+        for i in range(1, len(token) + 1):
+            current = [i]
+            for j in range(1, len(word) + 1):
+                cost = previous[j - 1] + (token[i - 1] != word[j - 1])
+                if (before is not None and j > 1 and token[i - 1] == word[j - 2]
+                        and token[i - 2] == word[j - 1]):
+                    cost = min(cost, before[j - 2] + 1)
+                current.append(min(previous[j] + 1, current[j - 1] + 1, cost))
+            before, previous = previous, current
+        return min(previous)
+
+    @staticmethod
+    def _subsequence_score(token: str, word: str) -> float:
+        position = 0
+        start = -1
+        for char in token:
+            position = word.find(char, position)
+            if position < 0:
+                return 0.0
+            if start < 0:
+                start = position
+            position += 1
+        return 0.3 * len(token) / (position - start)
+
+    def _match_words(self, token: str) -> Dict[str, float]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        vocabulary = self._vocabulary
+        scores = {}
+        short = len(token) < SEARCH_PREFIX_MIN_LENGTH
+        position = bisect.bisect_left(vocabulary, token)
+        while position < len(vocabulary) and vocabulary[position].startswith(token):
+            if short and len(scores) >= SEARCH_SHORT_PREFIX_WORDS:
+                break
+            word = vocabulary[position]
+            scores[word] = 1.0 if word == token else 0.8 + 0.2 * len(token) / len(word)
+            position += 1
+        if short:
+            return scores
+        allowed = 1 if len(token) < 8 else 2
+        grams = self._trigrams_of(token)
+        shared = {}
+        for gram in grams:
+            for word in self._trigrams.get(gram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        needed = max(1, len(grams) - 3 * allowed)
+        for word, count in shared.items():
+            if word in scores or count < needed:
+                continue
+            if token in word:
+                scores[word] = 0.6
+                continue
+            distance = self._prefix_distance(token, word)
+            if distance <= allowed:
+                scores[word] = 0.5 - 0.15 * distance
+        if len(token) < SEARCH_FUZZY_MIN_LENGTH:
+            return scores
+        position = bisect.bisect_left(vocabulary, token[0])
+        while position < len(vocabulary) and vocabulary[position][0] == token[0]:
+            word = vocabulary[position]
+            if word not in scores:
+                score = self._subsequence_score(token, word)
+                if score > 0:
+                    scores[word] = score
+            position += 1
+        return scores
+
+    def search(self, tokens: List[str], steps: List[Dict] = None) -> List[Dict]:
+        steps = list(steps or [])
+        for token in tokens[len(steps):]:
+            previous = steps[-1] if steps else None
+            best = {}
+            for word, score in self._match_words(token).items():
+                for row, weight in self._postings[word].items():
+                    if previous is not None and row not in previous:
+                        continue
+                    if score * weight > best.get(row, 0):
+                        best[row] = score * weight
+            if previous is not None:
+                best = {row: previous[row] + score for row, score in best.items()}
+            steps.append(best)
+        return steps
+
+PLAYLIST_SNAPSHOT_COLUMNS = ('I', 'I', 'I', 'q', 'I', 'I', 'I', 'q', 'd')
+PLAYLIST_SNAPSHOT_V1_COLUMNS = ('I', 'I', 'q', 'I', 'I', 'I', 'q', 'd')
+
+def _snapshot_align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def write_playlist_snapshot(f, items: List[PlaylistItem], sequence: int):
+    store = track_store
+    ids = items.ids if isinstance(items, TrackList) else array('I', [item.id for item in items])
+    strings = []
+    folder_indices = {}
+    tag_indices = {}
+
+    def index_of(table, key, text):
+        index = table.get(key)
+        if index is None:
+            index = table[key] = len(strings)
+            strings.append(text.encode('utf-8', 'surrogateescape').replace(b'\x00', b''))
+        return index
+
+    folders, tags, heap = store.folders, store.tags, store.heap
+    name_column = array('I')
+    title_column = array('I')
+    for row in ids:
+        start = store.name_start[row]
+        name_index = len(strings)
+        strings.append(heap[start:start + store.name_size[row]])
+        title_start = store.title_start[row]
+        if title_start == start:
+            title_column.append(name_index)
+        else:
+            title_column.append(len(strings))
+            strings.append(heap[title_start:title_start + store.title_size[row]].replace(b'\x00', b''))
+        name_column.append(name_index)
+    columns = [
+        array('I', [index_of(folder_indices, folder, folders[folder]) for folder in map(store.folder.__getitem__, ids)]),
+        name_column,
+        title_column,
+        array('q', map(store.duration.__getitem__, ids)),
+    ]
+    for tag_column in (store.artist, store.album, store.genre):
+        columns.append(array('I', [index_of(tag_indices, tag, tags[tag]) for tag in map(tag_column.__getitem__, ids)]))
+    columns.append(array('q', map(store.play_count.__getitem__, ids)))
+    columns.append(array('d', map(store.last_played.__getitem__, ids)))
+    blob = b'\x00'.join(strings)
+    f.write(PLAYLIST_SNAPSHOT_HEADER.pack(PLAYLIST_SNAPSHOT_MAGIC, PLAYLIST_SNAPSHOT_VERSION, sequence,
+                                          len(ids), len(strings), len(blob)))
+    f.write(blob)
+    offset = PLAYLIST_SNAPSHOT_HEADER.size + len(blob)
+    for column in columns:
+        padding = _snapshot_align(offset) - offset
+        f.write(b'\x00' * padding)
+        if sys.byteorder == 'big':
+            column.byteswap()
+        f.write(column.tobytes())
+        offset += padding + len(column) * column.itemsize
+
+def read_playlist_snapshot(path: str) -> Tuple[int, 'TrackList']:
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version, sequence, count, string_count, blob_size = PLAYLIST_SNAPSHOT_HEADER.unpack_from(mm)
+        if magic != PLAYLIST_SNAPSHOT_MAGIC or version not in (1, PLAYLIST_SNAPSHOT_VERSION):
+            raise ValueError("Unsupported playlist snapshot")
+        layout = PLAYLIST_SNAPSHOT_COLUMNS if version == PLAYLIST_SNAPSHOT_VERSION else PLAYLIST_SNAPSHOT_V1_COLUMNS
+        offset = PLAYLIST_SNAPSHOT_HEADER.size + blob_size
+        if offset > len(mm):
+            raise ValueError("Truncated playlist snapshot")
+        blob = mm[PLAYLIST_SNAPSHOT_HEADER.size:offset]
+        columns = []
+        for typecode in layout:
+            offset = _snapshot_align(offset)
+            end = offset + count * struct.calcsize(typecode)
+            if end > len(mm):
+                raise ValueError("Truncated playlist snapshot")
+            column = array(typecode)
+            column.frombytes(mm[offset:end])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns.append(column)
+            offset = end
+    strings = blob.split(b'\x00') if string_count else []
+    if len(strings) != string_count:
+        raise ValueError("Corrupt playlist snapshot string table")
+    if version == 1:
+        table = {}
+        paths = {}
+        for index in set(columns[0]):
+            parts = []
+            for value in split_track_path(strings[index].decode('utf-8', 'surrogateescape')):
+                position = table.get(value)
+                if position is None:
+                    position = table[value] = len(strings)
+                    strings.append(value.encode('utf-8', 'surrogateescape'))
+                parts.append(position)
+            paths[index] = parts
+        columns[0:1] = (array('I', [paths[index][0] for index in columns[0]]),
+                        array('I', [paths[index][1] for index in columns[0]]))
+        blob = b'\x00'.join(strings)
+    (folder_column, name_column, title_column, durations, artist_column, album_column, genre_column,
+     play_counts, last_played) = columns
+    sizes = array('I', map(len, strings))
+    starts = array('Q', accumulate(map((1).__add__, sizes), initial=0))
+    folder_ids = {index: track_store.folder_id(strings[index].decode('utf-8', 'surrogateescape'))
+                  for index in set(folder_column)}
+    tag_ids = {index: track_store.tag_id(strings[index].decode('utf-8', 'surrogateescape'))
+               for index in set(artist_column).union(album_column, genre_column)}
+    rows = track_store.extend(
+        blob,
+        array('I', map(folder_ids.__getitem__, folder_column)),
+        array('Q', map(starts.__getitem__, name_column)),
+        array('I', map(sizes.__getitem__, name_column)),
+        array('Q', map(starts.__getitem__, title_column)),
+        array('I', map(sizes.__getitem__, title_column)),
+        durations,
+        array('I', map(tag_ids.__getitem__, artist_column)),
+        array('I', map(tag_ids.__getitem__, album_column)),
+        array('I', map(tag_ids.__getitem__, genre_column)),
+        play_counts,
+        last_played,
+    )
+    return sequence, TrackList.from_ids(rows)
+
+class PlaylistJournal:
+    def __init__(self, snapshot_path: str = PLAYLIST_SNAPSHOT_FILE, journal_path: str = PLAYLIST_JOURNAL_FILE,
+                 interval: float = PLAYLIST_WRITE_INTERVAL, legacy_path: str = PLAYLIST_FILE):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.legacy_path = legacy_path
+        self.imported = False
+        self.dropped = 0
+        self.interval = interval
+        self.sequence = 0
+        self._records = 0
+        self._bytes = 0
+        self._pending = []
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._thread = None
+        self._file = None
+
+    def load(self) -> Tuple['TrackList', List[Dict[str, Any]]]:
+        self.dropped = 0
+        try:
+            snapshot_sequence, items = read_playlist_snapshot(self.snapshot_path)
+            self.imported = False
+        except (OSError, ValueError, IndexError, struct.error):
+            snapshot_sequence, items = self._load_legacy()
+            self.imported = bool(items)
+        records = []
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if isinstance(record, dict) and record.get('seq', 0) > snapshot_sequence:
+                        records.append(record)
+        except OSError:
+            pass
+        self.sequence = max([snapshot_sequence] + [record['seq'] for record in records])
+        self._records = len(records)
+        return items, records
+
+    def _load_legacy(self) -> Tuple[int, 'TrackList']:
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0, TrackList()
+        sequence = 0
+        if isinstance(data, dict):
+            sequence = int(data.get('sequence', 0))
+            data = data.get('items', [])
+        items = TrackList()
+        for entry in data if isinstance(data, list) else []:
+            try:
+                items.append(PlaylistItem.from_dict(entry))
+            except (TypeError, ValueError):
+                self.dropped += 1
+        return sequence, items
+
+    @staticmethod
+    def replay(items: 'TrackList', records: List[Dict[str, Any]]) -> 'TrackList':
+        ids = items.ids
+        tags = {}
+        for record in records:
+            try:
+                op = record['op']
+                if op == 'insert':
+                    position = record['at']
+                    ids[position:position] = array('I', [PlaylistItem.from_dict(entry).id
+                                                         for entry in record['items']])
+                elif op == 'remove':
+                    indices = [index for index in PlaylistJournal._resolve(items, record['at'], record.get('paths'))
+                               if 0 <= index < len(ids)]
+                    if indices:
+                        removed = set(indices)
+                        start, end = min(indices), max(indices) + 1
+                        ids[start:end] = array('I', [ids[index] for index in range(start, end) if index not in removed])
+                elif op == 'move':
+                    indices = [index for index in PlaylistJournal._resolve(items, record['at'], record.get('paths'))
+                               if 0 <= index < len(ids)]
+                    if indices:
+                        moving = set(indices)
+                        moved = array('I', [ids[index] for index in indices])
+                        start = min(min(indices), record['to'])
+                        end = min(max(max(indices) + 1, record['to'] + len(moved)), len(ids))
+                        kept = array('I', [ids[index] for index in range(start, end) if index not in moving])
+                        target = record['to'] - start
+                        ids[start:end] = kept[:target] + moved + kept[target:]
+                elif op == 'update':
+                    item = PlaylistItem.from_dict(record['item'])
+                    for index in PlaylistJournal._resolve(items, [record['at']], [item.path]):
+                        ids[index] = item.id
+                elif op == 'tags':
+                    tags[record['path']] = record
+                elif op == 'clear':
+                    del ids[:]
+                    tags.clear()
+            except (KeyError, IndexError, TypeError, ValueError):
+                pass
+        if tags:
+            folders = {}
+            for path, record in tags.items():
+                folder, _, name = path.rpartition('/')
+                folder_id = track_store.find_folder(folder + '/')
+                if folder_id is not None:
+                    folders.setdefault(folder_id, {})[name] = record
+            for item in items:
+                names = folders.get(track_store.folder[item.id])
+                record = names.get(item.name) if names is not None else None
+                if record is None:
+                    continue
+                if record.get('duration', 0) > 0:
+                    item.duration = record['duration']
+                for field in ('artist', 'album', 'genre'):
+                    if record.get(field):
+                        setattr(item, field, record[field])
+        return items
+
+    @staticmethod
+    def _resolve(items: 'TrackList', indices: List[int], paths: Optional[List[str]]) -> List[int]:
+        if paths is None or len(paths) != len(indices):
+            return indices
+        if all(0 <= index < len(items) and items[index].path == path for index, path in zip(indices, paths)):
+            return indices
+        positions = {}
+        for index, item in enumerate(items):
+            positions.setdefault(item.path, deque()).append(index)
+        resolved = []
+        for path in paths:
+            candidates = positions.get(path)
+            if candidates:
+                resolved.append(candidates.popleft())
+        return sorted(resolved)
+
+    def append(self, op: str, **fields):
+        self.sequence += 1
+        fields['seq'] = self.sequence
+        fields['op'] = op
+        with self._lock:
+            self._pending.append(fields)
+            self._records += 1
+        self._schedule()
+
+    def needs_compaction(self) -> bool:
+        with self._lock:
+            return self._records >= JOURNAL_COMPACT_RECORDS or self._bytes >= JOURNAL_COMPACT_BYTES
+
+    def compact(self, items: 'TrackList') -> bool:
+        with self._lock:
+            self._snapshot = (TrackList(items), self.sequence)
+            self._pending.clear()
+            self._records = 0
+        self._schedule()
+        return True
+
+    def _schedule(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="playlist-writer", daemon=True)
+                self._thread.start()
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._closing.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                snapshot, self._snapshot = self._snapshot, None
+                records, self._pending = self._pending, []
+            try:
+                if snapshot is not None:
+                    self._write_snapshot(*snapshot)
+                    self._truncate()
+                    if self.imported:
+                        self._retire_legacy()
+            except Exception:
+                if not self._closing.is_set():
+                    with self._lock:
+                        if self._snapshot is None:
+                            self._snapshot = snapshot
+                            self._pending[:0] = records
+                    self._wake.set()
+                    continue
+                records = []
+            try:
+                if records:
+                    self._write_records(records)
+            except Exception:
+                pass
+            if self._closing.is_set() and not self._wake.is_set():
+                self._close_file()
+                with self._lock:
+                    if not self._wake.is_set():
+                        self._thread = None
+                        return
+
+    def _retire_legacy(self):
+        try:
+            os.replace(self.legacy_path, self.legacy_path + ".imported")
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return
+        self.imported = False
+
+    def _write_records(self, records):
+        data = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':'),
+                                  default=PlaylistItem.to_dict) + '\n' for record in records)
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            self._file = open(self.journal_path, 'a', encoding='utf-8')
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        with self._lock:
+            self._bytes += len(data)
+
+    def _truncate(self):
+        self._close_file()
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            os.fsync(f.fileno())
+        with self._lock:
+            self._bytes = 0
+
+    def _write_snapshot(self, items, sequence: int):
+        directory = os.path.dirname(self.snapshot_path)
+        temp_file = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(prefix='.playlist_', suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                write_playlist_snapshot(f, items, sequence)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.snapshot_path)
+            temp_file = None
+        finally:
+            if temp_file and os.path.exists(temp_file):
+                try:
+                    os.unlink(temp_file)
+                except Exception:
+                    pass
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def flush(self, timeout: float = 10.0):
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        self._closing.set()
+        self._wake.set()
+        thread.join(timeout)
+        with self._lock:
+            if self._thread is None:
+                self._closing.clear()
+
+class PlaylistHistory:
+    def __init__(self, max_steps: int = HISTORY_MAX_STEPS, max_cells: int = HISTORY_MAX_CELLS):
+        self.max_steps = max_steps
+        self.max_cells = max_cells
+        self._undo = deque()
+        self._redo = []
+        self._cells = 0
+
+    @staticmethod
+    def _cost(entry) -> int:
+        return 1 + sum(len(part) for part in entry[1:] if isinstance(part, (list, array, TrackList)))
+
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._cells = 0
+
+    def record(self, entry):
+        for dropped in self._redo:
+            self._cells -= self._cost(dropped)
+        self._redo.clear()
+        self._undo.append(entry)
+        self._cells += self._cost(entry)
+        self._trim()
+
+    def record_insert(self, position: int, items: List[PlaylistItem], group=None):
+        if group is not None and self._undo and not self._redo:
+            last = self._undo[-1]
+            if last[0] == 'insert' and last[3] is group and last[1] + len(last[2]) == position:
+                last[2].extend(items)
+                self._cells += len(items)
+                self._trim()
+                return
+        self.record(('insert', position, TrackList(items), group))
+
+    def _trim(self):
+        while self._undo and (len(self._undo) > self.max_steps or self._cells > self.max_cells):
+            self._cells -= self._cost(self._undo.popleft())
+
+    def undo(self):
+        if not self._undo:
+            return None
+        entry = self._undo.pop()
+        self._redo.append(entry)
+        return entry
+
+    def redo(self):
+        if not self._redo:
+            return None
+        entry = self._redo.pop()
+        self._undo.append(entry)
+        return entry
+
+class PlaylistStats:
+    def __init__(self):
+        self.tracks = 0
+        self.duration = 0
+        self.bytes = 0
+        self.sized = 0
+        self.unknown_duration = 0
+        self.formats = {}
+
+    @staticmethod
+    def entry(row: 'PlaylistRow'):
+        item = row.item
+        extension = os.path.splitext(item.path)[1].lower().lstrip('.') or '?'
+        size = row.size
+        if size is None and row.details is not None and row.details.size > 0:
+            size = row.details.size
+        return (max(item.duration, 0), size, extension)
+
+    def add(self, row: 'PlaylistRow'):
+        row.stats_entry = self.entry(row)
+        self._apply(row.stats_entry, 1)
+
+    def remove(self, row: 'PlaylistRow'):
+        if row.stats_entry is not None:
+            self._apply(row.stats_entry, -1)
+            row.stats_entry = None
+
+    def update(self, row: 'PlaylistRow') -> bool:
+        if row.stats_entry is None:
+            return False
+        entry = self.entry(row)
+        if entry == row.stats_entry:
+            return False
+        self._apply(row.stats_entry, -1)
+        row.stats_entry = entry
+        self._apply(entry, 1)
+        return True
+
+    def _apply(self, entry, sign: int):
+        duration, size, extension = entry
+        self.tracks += sign
+        self.duration += sign * duration
+        if size is not None:
+            self.bytes += sign * size
+            self.sized += sign
+        if duration <= 0:
+            self.unknown_duration += sign
+        count = self.formats.get(extension, 0) + sign
+        if count > 0:
+            self.formats[extension] = count
+        else:
+            self.formats.pop(extension, None)
+
+    def summary(self) -> str:
+        parts = [f"{self.tracks} tracks"]
+        if self.duration > 0:
+            hours = self.duration // 3600
+            minutes = (self.duration % 3600) // 60
+            parts.append(f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m")
+        if self.bytes > 0:
+            size = float(self.bytes)
+            for unit in ("B", "KB", "MB", "GB", "TB"):
+                if size < 1024 or unit == "TB":
+                    break
+                size /= 1024
+            parts.append(f"{size:.1f} {unit}" if self.sized >= self.tracks else f"{size:.1f} {unit} (partial)")
+        if len(self.formats) > 1:
+            formats = sorted(self.formats.items(), key=lambda entry: -entry[1])[:3]
+            parts.append(", ".join(f"{extension.upper()} {count}" for extension, count in formats))
+        if self.unknown_duration:
+            parts.append(f"{self.unknown_duration} unknown length")
+        return " • ".join(parts)
+
+class PlaylistRow(GObject.Object):
+    __gtype_name__ = "LinAmpPlaylistRow"
+
+    def __init__(self, item: PlaylistItem, index: int = -1):
+        super().__init__()
+        self.item = item
+        self.index = index
+        self.search_words = None
+        self.details = None
+        self.details_requested = False
+        self.bound = 0
+        self.size = None
+        self.sort_keys = {}
+        self.sort_rank = None
+        self.stats_entry = None
+
+    def sort_key(self, field: str):
+        key = self.sort_keys.get(field)
+        if key is None:
+            item = self.item
+            if field == "title":
+                key = natural_sort_key(item.title or item.name)
+            elif field == "artist":
+                key = natural_sort_key(item.artist)
+            elif field == "album":
+                key = natural_sort_key(item.album)
+            elif field == "track":
+                key = natural_sort_key(item.name)
+            elif field == "path":
+                key = natural_sort_key(item.path)
+            elif field == "duration":
+                key = item.duration
+            elif field == "plays":
+                key = -item.play_count
+            else:
+                key = 0
+            self.sort_keys[field] = key
+        return key
+
+    @GObject.Property(type=str)
+    def label(self):
+        return self.item.get_display_name()
+
+class PlaylistModel(GObject.Object, Gio.ListModel):
+    __gtype_name__ = "LinAmpPlaylistModel"
+    __gsignals__ = {
+        'rows-refreshed': (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        'search-ready': (GObject.SignalFlags.RUN_FIRST, None, ()),
+    }
+
+    def __init__(self):
+        super().__init__()
+        self._rows = []
+        self._by_id = {}
+        self._by_path = {}
+        self.generation = 0
+        self.search_index = PlaylistSearchIndex()
+        self.stats = PlaylistStats()
+        self._warm_position = 0
+        self._warm_source = None
+        self._search_waiting = False
+
+    def do_get_item_type(self):
+        return PlaylistRow.__gtype__
+
+    def do_get_n_items(self):
+        return len(self._rows)
+
+    def do_get_item(self, position):
+        if position < len(self._rows):
+            return self._rows[position]
+        return None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def rows(self) -> List[PlaylistRow]:
+        return self._rows
+
+    def row(self, index: int) -> Optional[PlaylistRow]:
+        if 0 <= index < len(self._rows):
+            return self._rows[index]
+        return None
+
+    def _renumber(self, start: int, end: int):
+        rows = self._rows
+        for index in range(start, min(end, len(rows))):
+            rows[index].index = index
+
+    def _index_rows(self, rows: List[PlaylistRow]):
+        folders = track_store.folder
+        for row in rows:
+            self._by_id[row.item.id] = row
+            names = self._by_path.get(folders[row.item.id])
+            if names is None:
+                names = self._by_path[folders[row.item.id]] = {}
+            names.setdefault(row.item.name, []).append(row)
+
+    def _unindex_rows(self, rows: List[PlaylistRow]):
+        folders = track_store.folder
+        for row in rows:
+            row.index = -1
+            if self._by_id.get(row.item.id) is row:
+                del self._by_id[row.item.id]
+            names = self._by_path.get(folders[row.item.id])
+            same_path = names.get(row.item.name) if names is not None else None
+            if same_path is not None:
+                try:
+                    same_path.remove(row)
+                except ValueError:
+                    pass
+                if not same_path:
+                    del names[row.item.name]
+                    if not names:
+                        del self._by_path[folders[row.item.id]]
+
+    def rows_of_path(self, path: str) -> List['PlaylistRow']:
+        folder, _, name = path.rpartition('/')
+        names = self._by_path.get(track_store.find_folder(folder + '/'))
+        return list(names.get(name, ())) if names is not None else []
+
+    def position_of(self, item: PlaylistItem) -> Optional[int]:
+        row = self._by_id.get(item.id)
+        return row.index if row is not None and row.index >= 0 else None
+
+    def has_path(self, path: str) -> bool:
+        folder, _, name = path.rpartition('/')
+        names = self._by_path.get(track_store.find_folder(folder + '/'))
+        return names is not None and bool(names.get(name))
+
+    def positions_of_path(self, path: str) -> List[int]:
+        return sorted(row.index for row in self.rows_of_path(path) if row.index >= 0)
+
+    def splice(self, position: int, n_removals: int, items: List[PlaylistItem]):
+        position = max(0, min(position, len(self._rows)))
+        n_removals = max(0, min(n_removals, len(self._rows) - position))
+        removed_rows = self._rows[position:position + n_removals]
+        self._unindex_rows(removed_rows)
+        for row in removed_rows:
+            self.search_index.remove(row)
+            self.stats.remove(row)
+        new_rows = [PlaylistRow(item) for item in items]
+        self._index_rows(new_rows)
+        for row in new_rows:
+            self.stats.add(row)
+        self._rows[position:position + n_removals] = new_rows
+        if n_removals == len(new_rows):
+            self._renumber(position, position + len(new_rows))
+        else:
+            self._renumber(position, len(self._rows))
+        if n_removals or new_rows:
+            self.generation += 1
+            self._warm_search_index(position)
+            self.items_changed(position, n_removals, len(new_rows))
+
+    def _replace_span(self, start: int, end: int, rows: List[PlaylistRow]):
+        self._rows[start:end] = rows
+        if end - start == len(rows):
+            self._renumber(start, end)
+        else:
+            self._renumber(start, len(self._rows))
+        self.generation += 1
+        self.items_changed(start, end - start, len(rows))
+
+    def remove_positions(self, positions: List[int]):
+        positions = sorted({position for position in positions if 0 <= position < len(self._rows)})
+        if not positions:
+            return
+        start, end = positions[0], positions[-1] + 1
+        removed = set(positions)
+        kept = []
+        removed_rows = []
+        for position in range(start, end):
+            row = self._rows[position]
+            (removed_rows if position in removed else kept).append(row)
+        self._unindex_rows(removed_rows)
+        for row in removed_rows:
+            self.search_index.remove(row)
+            self.stats.remove(row)
+        self._replace_span(start, end, kept)
+
+    def move_positions(self, positions: List[int], target: int) -> int:
+        positions = sorted({position for position in positions if 0 <= position < len(self._rows)})
+        if not positions:
+            return target
+        target = max(0, min(target, len(self._rows)))
+        start = min(positions[0], target)
+        end = max(positions[-1] + 1, target)
+        moving = set(positions)
+        before = [self._rows[p] for p in range(start, target) if p not in moving]
+        moved = [self._rows[p] for p in positions]
+        after = [self._rows[p] for p in range(target, end) if p not in moving]
+        self._replace_span(start, end, before + moved + after)
+        return start + len(before)
+
+    def reset(self, items: List[PlaylistItem]):
+        existing = {row.item.id: row for row in self._rows}
+        rows = []
+        for index, item in enumerate(items):
+            row = existing.pop(item.id, None)
+            if row is None:
+                row = PlaylistRow(item)
+                self.stats.add(row)
+            row.index = index
+            rows.append(row)
+        for row in existing.values():
+            row.index = -1
+            self.search_index.remove(row)
+            self.stats.remove(row)
+        removed = len(self._rows)
+        self._rows = rows
+        self._by_id = {}
+        self._by_path = {}
+        self._index_rows(rows)
+        self.generation += 1
+        self._warm_search_index(0)
+        if removed or rows:
+            self.items_changed(0, removed, len(rows))
+
+    def _warm_search_index(self, position: int):
+        self._warm_position = min(self._warm_position, position)
+        if self._warm_source is None:
+            self._warm_source = GLib.idle_add(self._warm_step, priority=GLib.PRIORITY_LOW)
+
+    def _warm_step(self, chunk: int = SEARCH_WARM_CHUNK):
+        rows = self._rows
+        end = min(self._warm_position + chunk, len(rows))
+        for index in range(self._warm_position, end):
+            if rows[index].search_words is None:
+                self.search_index.add(rows[index])
+        self._warm_position = end
+        if end < len(rows):
+            return True
+        self._warm_source = None
+        if self._search_waiting:
+            self._search_waiting = False
+            self.emit('search-ready')
+        return False
+
+    def request_search_index(self) -> bool:
+        if self._warm_source is None:
+            return True
+        self._search_waiting = True
+        return False
+
+    def set_details(self, items: List[PlaylistItem], metadata: TrackMetadata):
+        for item in items:
+            row = self._by_id.get(item.id)
+            if row is not None:
+                row.details = metadata
+        self.refresh(items)
+
+    def set_sizes(self, sizes) -> bool:
+        changed = False
+        for path, size in sizes:
+            for row in self.rows_of_path(path):
+                row.size = size
+                changed = self.stats.update(row) or changed
+        return changed
+
+    def refresh(self, items: List[PlaylistItem]):
+        searchable = False
+        resorted = []
+        for item in items:
+            row = self._by_id.get(item.id)
+            if row is not None:
+                searchable = self.search_index.update(row) or searchable
+                self.stats.update(row)
+                sort_keys = row.sort_keys
+                row.sort_keys = {}
+                if any(row.sort_key(field) != key for field, key in sort_keys.items()):
+                    resorted.append(row)
+                row.notify("label")
+        if searchable:
+            self.generation += 1
+        self.emit('rows-refreshed', resorted)
+
+    def reposition(self, rows: List['PlaylistRow']):
+        indices = sorted(row.index for row in rows if row.index >= 0)
+        start = 0
+        while start < len(indices):
+            end = start + 1
+            while end < len(indices) and indices[end] == indices[end - 1] + 1:
+                end += 1
+            self.items_changed(indices[start], end - start, end - start)
+            start = end
+
 class PlaylistTab(Gtk.Box):
+    COLUMNS = (
+        ("Title", "title", True),
+        ("Artist", "artist", True),
+        ("Album", "album", True),
+        ("Time", "duration", False),
+        ("Bitrate", "bitrate", False),
+        ("Plays", "play_count", False),
+    )
+    NUMERIC_COLUMNS = ("duration", "bitrate", "play_count")
+    SORT_ORDERS = (
+        ("Default Order", ()),
+        ("By Title", ("title",)),
+        ("By Artist", ("artist", "album", "track")),
+        ("By Album", ("album", "track")),
+        ("By Path", ("path",)),
+        ("By Duration", ("duration", "title")),
+        ("Most Played", ("plays", "title")),
+    )
+
     def __init__(self, player):
         super().__init__(orientation=Gtk.Orientation.VERTICAL)
         self.player = player
         self.add_css_class("playlist-tab")
-        self.playlist_store = Gtk.StringList()
+        self.playlist_store = PlaylistModel()
+        self.search_store = Gio.ListStore(item_type=PlaylistRow)
+        self.search_rows = None
+        self.active_smart = None
+        self._search_source = None
+        self._last_view = None
+        self._view_serial = 0
         self.filtered_store = None
         self.filter_model = None
+        self.sort_fields = ()
         main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
         main_box.set_margin_top(16)
         main_box.set_margin_bottom(16)
@@ -292,6 +3645,19 @@ class PlaylistTab(Gtk.Box):
         clear_search_btn = self._create_modern_button("Clear", "edit-clear-symbolic")
         clear_search_btn.connect("clicked", self.on_clear_search)
         search_container.append(clear_search_btn)
+        smart_container = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        search_section.append(smart_container)
+        self.smart_names = Gtk.StringList()
+        self.smart_dropdown = Gtk.DropDown(model=self.smart_names)
+        self.smart_dropdown.add_css_class("sort-dropdown")
+        self.smart_dropdown.set_hexpand(True)
+        self._reload_smart_names()
+        self.smart_dropdown.connect("notify::selected", self.on_smart_playlist_changed)
+        smart_container.append(self.smart_dropdown)
+        smart_btn = self._create_modern_button("Smart", "view-pulse-symbolic")
+        smart_btn.set_tooltip_text("Create or edit a smart playlist")
+        smart_btn.connect("clicked", self.on_edit_smart_playlist)
+        smart_container.append(smart_btn)
         toolbar_section = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=8)
         main_box.append(toolbar_section)
         toolbar_header = Gtk.Label(label="Playlist Actions")
@@ -316,10 +3682,18 @@ class PlaylistTab(Gtk.Box):
         shuffle_btn = self._create_modern_button("Shuffle", "media-playlist-shuffle-symbolic")
         shuffle_btn.connect("clicked", self.on_shuffle)
         main_toolbar.append(shuffle_btn)
+        undo_btn = self._create_modern_button("Undo", "edit-undo-symbolic")
+        undo_btn.set_tooltip_text("Undo the last playlist edit")
+        undo_btn.connect("clicked", self.on_undo)
+        main_toolbar.append(undo_btn)
+        redo_btn = self._create_modern_button("Redo", "edit-redo-symbolic")
+        redo_btn.set_tooltip_text("Redo the last undone playlist edit")
+        redo_btn.connect("clicked", self.on_redo)
+        main_toolbar.append(redo_btn)
         secondary_toolbar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         secondary_toolbar.set_homogeneous(True)
         toolbar_section.append(secondary_toolbar)
-        sort_dropdown = Gtk.DropDown.new_from_strings(["Default Order", "By Title", "By Path", "By Duration"])
+        sort_dropdown = Gtk.DropDown.new_from_strings([name for name, fields in self.SORT_ORDERS])
         sort_dropdown.add_css_class("sort-dropdown")
         sort_dropdown.connect("notify::selected", self.on_sort_changed)
         secondary_toolbar.append(sort_dropdown)
@@ -333,6 +3707,14 @@ class PlaylistTab(Gtk.Box):
         remove_dups_btn = self._create_modern_button("Remove Dups", "view-refresh-symbolic")
         remove_dups_btn.connect("clicked", self.on_remove_duplicates)
         secondary_toolbar.append(remove_dups_btn)
+        move_up_btn = self._create_modern_button("Up", "go-up-symbolic")
+        move_up_btn.set_tooltip_text("Move selected tracks up")
+        move_up_btn.connect("clicked", self.on_move_up)
+        secondary_toolbar.append(move_up_btn)
+        move_down_btn = self._create_modern_button("Down", "go-down-symbolic")
+        move_down_btn.set_tooltip_text("Move selected tracks down")
+        move_down_btn.connect("clicked", self.on_move_down)
+        secondary_toolbar.append(move_down_btn)
         stats_container = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
         stats_container.set_halign(Gtk.Align.END)
         stats_container.set_margin_top(8)
@@ -357,17 +3739,29 @@ class PlaylistTab(Gtk.Box):
         playlist_container.append(scrolled)
         self.filter_model = Gtk.FilterListModel()
         self.filter_model.set_model(self.playlist_store)
-        self.selection_model = Gtk.SingleSelection(model=self.filter_model)
+        self.sorter = Gtk.CustomSorter.new(self._compare_rows, None)
+        self.sort_model = Gtk.SortListModel(model=self.filter_model)
+        self.sort_model.set_incremental(True)
+        self.selection_model = Gtk.MultiSelection(model=self.sort_model)
+        self.playlist_store.connect("rows-refreshed", self._on_rows_refreshed)
+        self.playlist_store.connect("search-ready", lambda *args: self.refresh_view())
         self.column_view = Gtk.ColumnView(model=self.selection_model)
         self.column_view.add_css_class("playlist-view")
         self.column_view.set_hexpand(True)
         self.column_view.set_vexpand(True)
         self.column_view.set_size_request(-1, 180)
-        factory = Gtk.SignalListItemFactory()
-        factory.connect('setup', self._on_factory_setup)
-        factory.connect('bind', self._on_factory_bind)
-        column = Gtk.ColumnViewColumn(title="Tracks", factory=factory)
-        self.column_view.append_column(column)
+        self._details_queue = []
+        self._details_cancelled = []
+        self._details_probing = set()
+        for title, field, expand in self.COLUMNS:
+            factory = Gtk.SignalListItemFactory()
+            factory.connect('setup', self._on_factory_setup, field)
+            factory.connect('bind', self._on_factory_bind, field)
+            factory.connect('unbind', self._on_factory_unbind)
+            column = Gtk.ColumnViewColumn(title=title, factory=factory)
+            column.set_resizable(True)
+            column.set_expand(expand)
+            self.column_view.append_column(column)
         scrolled.set_child(self.column_view)
         self.selection_model.connect("selection-changed", self.on_selection_changed)
         self.column_view.connect("activate", self.on_row_activated)
@@ -508,6 +3902,11 @@ class PlaylistTab(Gtk.Box):
             "Export": "📤",
             "Remove Dups": "🔄",
             "Clear": "🧹",
+            "Smart": "✨",
+            "Up": "⬆",
+            "Down": "⬇",
+            "Undo": "↶",
+            "Redo": "↷",
         }
         return emoji_fallbacks.get(text, text)
 
@@ -553,89 +3952,349 @@ class PlaylistTab(Gtk.Box):
                 self.player.add_folder_to_playlist(folder_path)
         dialog.destroy()
 
-    def on_remove(self, button):
-        position = self.selection_model.get_selected()
-        if position != Gtk.INVALID_LIST_POSITION:
-            if position < len(self.playlist_store):
-                self.playlist_store.remove(position)
-                if position < len(self.player.playlist):
-                    self.player.playlist.pop(position)
+    def _selected_source_indices(self):
+        selection = self.selection_model.get_selection()
+        indices = []
+        for nth in range(selection.get_size()):
+            index = self._source_index(selection.get_nth(nth))
+            if index is not None:
+                indices.append(index)
+        return indices
+
+    def select_source_index(self, index):
+        if self._view_is_source_order() and 0 <= index < len(self.playlist_store):
+            self.selection_model.select_item(index, True)
+
+    def on_remove(self, button):
+        indices = self._selected_source_indices()
+        if indices:
+            self.player.remove_playlist_indices(indices)
+            self.player.save_playlist()
+
+    def on_move_up(self, button):
+        self._move_selection(-1)
+
+    def on_move_down(self, button):
+        self._move_selection(1)
+
+    def _view_is_source_order(self):
+        return self.search_rows is None and not self.sort_fields
+
+    def _move_selection(self, direction):
+        if not self._view_is_source_order():
+            return
+        indices = sorted(self._selected_source_indices())
+        if not indices:
+            return
+        if direction < 0:
+            target = max(0, indices[0] - 1)
+        else:
+            target = min(len(self.player.playlist), indices[-1] + 2)
+        start = self.player.move_playlist_indices(indices, target)
+        if start is not None:
+            self.selection_model.select_range(start, len(indices), True)
+            self.player.save_playlist()
 
     def on_clear(self, button):
-        while self.playlist_store.get_n_items() > 0:
-            self.playlist_store.remove(0)
-        self.player.playlist.clear()
-        self.update_statistics()
+        self.player.cancel_folder_scans()
+        self.player.folder_watcher.clear()
+        self.player.clear_playlist()
 
-    def _on_factory_setup(self, factory, list_item):
+    def _on_factory_setup(self, factory, list_item, field):
         label = Gtk.Label()
-        label.set_halign(Gtk.Align.START)
+        label.set_ellipsize(Pango.EllipsizeMode.END)
+        if field in self.NUMERIC_COLUMNS:
+            label.set_xalign(1.0)
+        else:
+            label.set_xalign(0.0)
         list_item.set_child(label)
 
-    def _on_factory_bind(self, factory, list_item):
+    def _on_factory_bind(self, factory, list_item, field):
+        label = list_item.get_child()
+        row = list_item.get_item()
+        if row is None:
+            return
+        label.set_text(self._cell_text(row, field))
+        label._row = row
+        label._handler = row.connect("notify::label", lambda r, pspec: label.set_text(self._cell_text(r, field)))
+        row.bound += 1
+        if row.details is None and not row.details_requested:
+            row.details_requested = True
+            if not self._details_queue:
+                GLib.idle_add(self._flush_details_queue)
+            self._details_queue.append(row)
+
+    def _on_factory_unbind(self, factory, list_item):
         label = list_item.get_child()
-        item = list_item.get_item()
-        if item is not None:
-            text = item.get_string() if hasattr(item, 'get_string') else str(item)
-            label.set_text(text)
+        row = getattr(label, '_row', None)
+        if row is not None:
+            row.disconnect(label._handler)
+            label._row = None
+            row.bound -= 1
+            if row.bound > 0:
+                return
+            probing = row in self._details_probing
+            self._details_probing.discard(row)
+            if row.details is None and row.details_requested:
+                row.details_requested = False
+                if probing:
+                    if not self._details_cancelled:
+                        GLib.idle_add(self._flush_details_cancelled)
+                    self._details_cancelled.append(row)
+
+    def _flush_details_queue(self):
+        rows = [row for row in self._details_queue if row.details_requested and row.bound > 0]
+        self._details_queue = []
+        self._details_probing.update(rows)
+        self.player.metadata.request([row.item for row in rows])
+        return False
+
+    def _flush_details_cancelled(self):
+        rows = self._details_cancelled
+        self._details_cancelled = []
+        self.player.metadata.cancel([row.item for row in rows if not row.details_requested])
+        return False
+
+    def _cell_text(self, row, field):
+        item = row.item
+        pending = "…" if row.details is None else ""
+        if field == "title":
+            return item.get_display_name()
+        if field == "artist":
+            return item.artist or pending
+        if field == "album":
+            return item.album or pending
+        if field == "duration":
+            if item.duration > 0:
+                return f"{item.duration // 60}:{item.duration % 60:02d}"
+            return pending or "—"
+        if field == "bitrate":
+            if row.details is not None and row.details.bitrate:
+                return f"{row.details.bitrate} kbps"
+            return pending or "—"
+        if field == "play_count":
+            return str(item.play_count)
+        return ""
 
     def on_selection_changed(self, selection, position, n_items):
         pass
 
     def on_search_changed(self, entry):
-        search_text = entry.get_text().lower()
-        if not search_text:
-            self.filter_model.set_filter(None)
-        else:
-            filter_obj = Gtk.CustomFilter()
-            filter_obj.set_filter_func(lambda item: self._filter_func(item, search_text))
-            self.filter_model.set_filter(filter_obj)
+        self._schedule_view()
+
+    def _schedule_view(self):
+        if self._search_source is not None:
+            GLib.source_remove(self._search_source)
+        self._search_source = GLib.timeout_add(SEARCH_DEBOUNCE_INTERVAL, self._on_search_timeout)
+
+    def _on_search_timeout(self):
+        self._search_source = None
+        self._apply_view()
+        return False
+
+    def _apply_view(self):
+        if self._search_source is not None:
+            GLib.source_remove(self._search_source)
+            self._search_source = None
+        self._view_serial += 1
+        serial = self._view_serial
+        tokens = re.findall(r'\w+', fold_search_text(self.search_entry.get_text()))
+        if not tokens:
+            self._show_view(serial, tokens, None)
+            return
+        library = self.player.library
 
-    def _filter_func(self, item, search_text):
-        if item is None:
+        def fetch():
+            hits = library.search(' '.join(tokens))
+            GLib.idle_add(self._show_view, serial, tokens, hits)
+        threading.Thread(target=fetch, daemon=True).start()
+
+    def _show_view(self, serial, tokens, hits):
+        if serial != self._view_serial:
+            return False
+        members = self.active_smart.members if self.active_smart is not None else None
+        if not tokens and members is None:
+            self._last_view = None
+            self._show_search_results(None)
             return False
-        text = item.get_string().lower()
-        return search_text in text
+        store = self.playlist_store
+        if tokens:
+            complete = store.request_search_index()
+            steps = []
+            last = self._last_view
+            if last is not None and last[0] == store.generation:
+                for previous, token in zip(last[1], tokens):
+                    if previous != token:
+                        break
+                    steps.append(last[2][len(steps)])
+            steps = store.search_index.search(tokens, steps)
+            self._last_view = (store.generation, tokens, steps) if complete else None
+            scores = steps[-1]
+            ranked = {}
+            for path in hits or ():
+                for row in store.rows_of_path(path):
+                    ranked.setdefault(row, len(ranked))
+            rows = sorted(ranked, key=ranked.get)
+            rows.extend(sorted((row for row in scores if row not in ranked),
+                               key=lambda row: (-scores[row], row.index)))
+        else:
+            rows = list(store.rows())
+        if members is not None:
+            rows = [row for row in rows if row.item.id in members]
+        self._show_search_results(rows)
+        return False
+
+    def refresh_view(self):
+        self._last_view = None
+        if self.active_smart is not None or self.search_rows is not None:
+            self._schedule_view()
+
+    def _reload_smart_names(self):
+        names = ["All Tracks"] + [playlist.name for playlist in self.player.smart_playlists.playlists]
+        self.smart_names.splice(0, self.smart_names.get_n_items(), names)
+
+    def on_smart_playlist_changed(self, dropdown, pspec):
+        selected = dropdown.get_selected()
+        playlists = self.player.smart_playlists.playlists
+        if selected == Gtk.INVALID_LIST_POSITION or selected == 0 or selected > len(playlists):
+            self.active_smart = None
+        else:
+            self.active_smart = playlists[selected - 1]
+        self._apply_view()
+
+    def on_edit_smart_playlist(self, button):
+        dialog = Gtk.Window(title="Smart Playlist", modal=True)
+        root = self.get_root()
+        if root:
+            dialog.set_transient_for(root)
+        dialog.set_default_size(420, -1)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=8)
+        box.set_margin_top(12)
+        box.set_margin_bottom(12)
+        box.set_margin_start(12)
+        box.set_margin_end(12)
+        dialog.set_child(box)
+        name_entry = Gtk.Entry()
+        name_entry.set_placeholder_text("Name")
+        query_entry = Gtk.Entry()
+        query_entry.set_placeholder_text("genre = jazz AND duration > 5 min AND not played in 30 days")
+        if self.active_smart is not None:
+            name_entry.set_text(self.active_smart.name)
+            query_entry.set_text(self.active_smart.query)
+        error_label = Gtk.Label()
+        error_label.set_halign(Gtk.Align.START)
+        error_label.add_css_class("stats-label")
+        box.append(name_entry)
+        box.append(query_entry)
+        box.append(error_label)
+        buttons = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        buttons.set_halign(Gtk.Align.END)
+        box.append(buttons)
+        delete_btn = Gtk.Button(label="Delete")
+        delete_btn.set_sensitive(self.active_smart is not None)
+        save_btn = Gtk.Button(label="Save")
+        save_btn.add_css_class("suggested-action")
+        buttons.append(delete_btn)
+        buttons.append(save_btn)
+
+        def on_save(btn):
+            name = name_entry.get_text().strip()
+            query = query_entry.get_text().strip()
+            if not name or not query:
+                error_label.set_text("Name and rules are required")
+                return
+            try:
+                playlist = self.player.smart_playlists.define(name, query, self.player.playlist)
+            except ValueError as e:
+                error_label.set_text(str(e))
+                return
+            self._reload_smart_names()
+            self.smart_dropdown.set_selected(self.player.smart_playlists.playlists.index(playlist) + 1)
+            dialog.destroy()
+
+        def on_delete(btn):
+            if self.active_smart is not None:
+                self.player.smart_playlists.delete(self.active_smart.name)
+                self.active_smart = None
+                self._reload_smart_names()
+                self.smart_dropdown.set_selected(0)
+            dialog.destroy()
+
+        save_btn.connect("clicked", on_save)
+        delete_btn.connect("clicked", on_delete)
+        dialog.present()
+
+    def _show_search_results(self, rows):
+        self.search_rows = rows
+        self.filter_model.set_filter(None)
+        if rows is None:
+            self.filter_model.set_model(self.playlist_store)
+            self.search_store.splice(0, self.search_store.get_n_items(), [])
+        else:
+            self.search_store.splice(0, self.search_store.get_n_items(), rows)
+            self.filter_model.set_model(self.search_store)
+
+    def _source_index(self, position):
+        row = self.selection_model.get_item(position)
+        if row is None or row.index < 0:
+            return None
+        return row.index
 
     def on_clear_search(self, button):
         self.search_entry.set_text("")
-        self.filter_model.set_filter(None)
+        self._view_serial += 1
+        self._show_search_results(None)
 
     def on_shuffle(self, button):
         if self.player.playlist:
-            import random
-            random.shuffle(self.player.playlist)
-            self.player._update_playlist_display()
+            self.player.shuffle_playlist()
             self.player.save_playlist()
 
+    def on_undo(self, button):
+        self.player.undo_playlist_edit()
+
+    def on_redo(self, button):
+        self.player.redo_playlist_edit()
+
     def on_sort_changed(self, dropdown, pspec):
         selected = dropdown.get_selected()
-        if selected == 0:
-            pass
-        elif selected == 1:
-            self.player.playlist.sort(key=lambda x: x.title.lower())
-        elif selected == 2:
-            self.player.playlist.sort(key=lambda x: x.path.lower())
-        elif selected == 3:
-            self.player.playlist.sort(key=lambda x: x.duration)
-        if selected != 0:
-            self.player._update_playlist_display()
-            self.player.save_playlist()
+        if selected >= len(self.SORT_ORDERS):
+            selected = 0
+        self.sort_fields = self.SORT_ORDERS[selected][1]
+        if not self.sort_fields:
+            self.sort_model.set_sorter(None)
+            return
+        self._rank_rows()
+        if self.sort_model.get_sorter() is None:
+            self.sort_model.set_sorter(self.sorter)
+
+    def _sort_key(self, row):
+        fields = self.sort_fields
+        if len(fields) == 1:
+            return row.sort_key(fields[0])
+        return tuple(row.sort_key(field) for field in fields)
+
+    def _compare_rows(self, a, b, user_data=None):
+        if a.sort_rank is None or b.sort_rank is None:
+            a, b = self._sort_key(a), self._sort_key(b)
+        else:
+            a, b = a.sort_rank, b.sort_rank
+        return (a > b) - (a < b)
+
+    def _rank_rows(self):
+        ordered = sorted(self.playlist_store.rows(), key=self._sort_key)
+        for rank, row in enumerate(ordered):
+            row.sort_rank = rank
+        self.sorter.changed(Gtk.SorterChange.DIFFERENT)
+
+    def _on_rows_refreshed(self, store, rows):
+        for row in rows:
+            row.sort_rank = None
+        if self.sort_fields and rows:
+            store.reposition(rows)
 
     def update_statistics(self):
-        total_tracks = len(self.player.playlist)
-        total_duration = sum(item.duration for item in self.player.playlist if item.duration > 0)
-        if total_duration > 0:
-            hours = total_duration // 3600
-            minutes = (total_duration % 3600) // 60
-            if hours > 0:
-                duration_text = f"{hours}h {minutes}m"
-            else:
-                duration_text = f"{minutes}m"
-            stats_text = f"{total_tracks} tracks • {duration_text}"
-        else:
-            stats_text = f"{total_tracks} tracks"
-        self.stats_label.set_text(stats_text)
+        self.stats_label.set_text(self.playlist_store.stats.summary())
 
     def on_import_m3u(self, button):
         dialog = Gtk.FileChooserNative(
@@ -675,9 +4334,7 @@ class PlaylistTab(Gtk.Box):
                 if not os.path.isabs(line):
                     m3u_dir = os.path.dirname(filepath)
                     line = os.path.join(m3u_dir, line)
-                line = os.path.abspath(os.path.expanduser(line))
-                if os.path.exists(line) and os.path.isfile(line):
-                    imported_files.append(line)
+                imported_files.append(os.path.abspath(os.path.expanduser(line)))
             if imported_files:
                 self.player.add_to_playlist(imported_files)
         except Exception:
@@ -718,7 +4375,7 @@ class PlaylistTab(Gtk.Box):
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write("#EXTM3U\n")
                 for item in self.player.playlist:
-                    if hasattr(item, 'path') and os.path.exists(item.path):
+                    if hasattr(item, 'path') and not file_probe.known_missing(item.path):
                         if hasattr(item, 'duration') and item.duration > 0 and hasattr(item, 'title'):
                             f.write(f"#EXTINF:{item.duration},{item.title}\n")
                         f.write(f"{item.path}\n")
@@ -731,41 +4388,280 @@ class PlaylistTab(Gtk.Box):
             return
         seen_paths = set()
         seen_titles = set()
-        duplicates_removed = 0
-        unique_playlist = []
-        for item in self.player.playlist:
+        duplicates = []
+        for index, item in enumerate(self.player.playlist):
             if item.path in seen_paths:
-                duplicates_removed += 1
+                duplicates.append(index)
                 continue
             title_key = item.title.lower().strip()
             if title_key in seen_titles and title_key != "":
-                duplicates_removed += 1
+                duplicates.append(index)
                 continue
             seen_paths.add(item.path)
             seen_titles.add(title_key)
-            unique_playlist.append(item)
-        if duplicates_removed > 0:
-            self.player.playlist = unique_playlist
-            self.player._update_playlist_display()
+        if duplicates:
+            self.player.remove_playlist_indices(duplicates)
             self.player.save_playlist()
-            pass
-        else:
-            pass
 
     def on_row_activated(self, column_view, position):
-        if hasattr(self, 'filter_model') and self.filter_model.get_filter():
-            item = self.selection_model.get_item(position)
-            if item is not None:
-                track_title = item.get_string()
-                for i, playlist_item in enumerate(self.player.playlist):
-                    if playlist_item.title == track_title:
-                        self.player.play_track(i)
-                        break
-        else:
-            item = self.playlist_store.get_item(position)
-            if item is not None:
-                track_path = item.get_string()
-                self.player.play_track(position)
+        index = self._source_index(position)
+        if index is not None:
+            self.player.play_track(index)
+
+class LibraryNode(GObject.Object):
+    __gtype_name__ = "LinAmpLibraryNode"
+
+    def __init__(self, kind: str, artist: str = "", album: str = "", count: int = 0,
+                 albums: List[Tuple[str, int]] = None, item: PlaylistItem = None):
+        super().__init__()
+        self.kind = kind
+        self.artist = artist
+        self.album = album
+        self.count = count
+        self.albums = albums
+        self.item = item
+        self.children = None
+
+    def sort_key(self):
+        if self.kind == "artist":
+            return self.artist.casefold(), self.artist
+        return self.album.casefold(), self.album
+
+    @GObject.Property(type=str)
+    def label(self):
+        return self.get_label()
+
+    def get_label(self) -> str:
+        if self.kind == "artist":
+            name = self.artist or "Unknown Artist"
+            return f"{name}  ({len(self.albums)} albums, {self.count} tracks)"
+        if self.kind == "album":
+            name = self.album or "Unknown Album"
+            return f"{name}  ({self.count} tracks)"
+        name = self.item.get_display_name()
+        if self.item.duration > 0:
+            return f"{name}  {self.item.duration // 60}:{self.item.duration % 60:02d}"
+        return name
+
+class LibraryTab(Gtk.Box):
+    def __init__(self, player):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL)
+        self.player = player
+        self.add_css_class("playlist-tab")
+        self._dirty = True
+        self._generation = 0
+        self._rebuild_source = None
+        self._search_source = None
+        self._query = ""
+        main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
+        main_box.set_margin_top(16)
+        main_box.set_margin_bottom(16)
+        main_box.set_margin_start(16)
+        main_box.set_margin_end(16)
+        self.append(main_box)
+        header = Gtk.Label(label="Artists & Albums")
+        header.add_css_class("section-header")
+        header.set_halign(Gtk.Align.START)
+        main_box.append(header)
+        self.search_entry = Gtk.Entry()
+        self.search_entry.set_placeholder_text("Search library...")
+        self.search_entry.add_css_class("search-entry")
+        self.search_entry.connect("changed", self.on_search_changed)
+        main_box.append(self.search_entry)
+        self.stats_label = Gtk.Label(label="")
+        self.stats_label.add_css_class("stats-label")
+        self.stats_label.set_halign(Gtk.Align.END)
+        main_box.append(self.stats_label)
+        scrolled = Gtk.ScrolledWindow(
+            hscrollbar_policy=Gtk.PolicyType.AUTOMATIC,
+            vscrollbar_policy=Gtk.PolicyType.AUTOMATIC
+        )
+        scrolled.add_css_class("playlist-scrolled")
+        scrolled.set_hexpand(True)
+        scrolled.set_vexpand(True)
+        main_box.append(scrolled)
+        self.root_store = Gio.ListStore(item_type=LibraryNode)
+        self.tree_model = Gtk.TreeListModel.new(self.root_store, False, False, self._create_children)
+        self.selection_model = Gtk.SingleSelection(model=self.tree_model)
+        factory = Gtk.SignalListItemFactory()
+        factory.connect('setup', self._on_factory_setup)
+        factory.connect('bind', self._on_factory_bind)
+        factory.connect('unbind', self._on_factory_unbind)
+        self.list_view = Gtk.ListView(model=self.selection_model, factory=factory)
+        self.list_view.add_css_class("playlist-view")
+        self.list_view.connect("activate", self.on_row_activated)
+        scrolled.set_child(self.list_view)
+        self.connect("map", self._on_map)
+
+    def _create_children(self, node):
+        if node.kind == "artist":
+            node.children = Gio.ListStore(item_type=LibraryNode)
+            node.children.splice(0, 0, [LibraryNode("album", node.artist, album, count)
+                                        for album, count in node.albums])
+            return node.children
+        if node.kind == "album":
+            node.children = Gio.ListStore(item_type=LibraryNode)
+            self._load_tracks(node)
+            return node.children
+        return None
+
+    def _load_tracks(self, node):
+        def fetch():
+            items = self.player.library.album_tracks(node.artist, node.album)
+            GLib.idle_add(fill, items)
+
+        def fill(items):
+            store = node.children
+            if store is not None:
+                store.splice(0, store.get_n_items(),
+                             [LibraryNode("track", node.artist, node.album, item=item) for item in items])
+            return False
+        threading.Thread(target=fetch, daemon=True).start()
+
+    def _on_factory_setup(self, factory, list_item):
+        expander = Gtk.TreeExpander()
+        label = Gtk.Label()
+        label.set_halign(Gtk.Align.START)
+        label.set_ellipsize(Pango.EllipsizeMode.END)
+        expander.set_child(label)
+        list_item.set_child(expander)
+
+    def _on_factory_bind(self, factory, list_item):
+        expander = list_item.get_child()
+        row = list_item.get_item()
+        expander.set_list_row(row)
+        node = row.get_item() if row is not None else None
+        if node is not None:
+            label = expander.get_child()
+            label.set_text(node.get_label())
+            label._node = node
+            label._handler = node.connect("notify::label", lambda n, pspec: label.set_text(n.get_label()))
+
+    def _on_factory_unbind(self, factory, list_item):
+        label = list_item.get_child().get_child()
+        node = getattr(label, '_node', None)
+        if node is not None:
+            node.disconnect(label._handler)
+            label._node = None
+
+    def invalidate(self):
+        self._dirty = True
+        if self.get_mapped() and self._rebuild_source is None:
+            self._rebuild_source = GLib.timeout_add(1000, self._rebuild_timeout)
+
+    def _on_map(self, widget):
+        if self._dirty:
+            self.rebuild()
+
+    def _rebuild_timeout(self):
+        self._rebuild_source = None
+        self.rebuild()
+        return False
+
+    def on_search_changed(self, entry):
+        if self._search_source is not None:
+            GLib.source_remove(self._search_source)
+        self._search_source = GLib.timeout_add(SEARCH_DEBOUNCE_INTERVAL, self._on_search_timeout)
+
+    def _on_search_timeout(self):
+        self._search_source = None
+        query = self.search_entry.get_text().strip()
+        if query != self._query:
+            self._query = query
+            self.root_store.remove_all()
+            self.rebuild()
+        return False
+
+    def rebuild(self):
+        self._dirty = False
+        self._generation += 1
+        generation = self._generation
+        if self._query:
+            threading.Thread(target=self._search_tracks, args=(generation, self._query), daemon=True).start()
+            return
+        threading.Thread(target=self._build_index, args=(generation,), daemon=True).start()
+
+    def _search_tracks(self, generation, query):
+        items = self.player.library.search_items(query, LIBRARY_SEARCH_LIMIT)
+        GLib.idle_add(self._apply_search, generation, items)
+
+    def _apply_search(self, generation, items):
+        if generation != self._generation:
+            return False
+        self.root_store.splice(0, self.root_store.get_n_items(),
+                               [LibraryNode("track", item.artist, item.album, item=item) for item in items])
+        more = "+" if len(items) >= LIBRARY_SEARCH_LIMIT else ""
+        self.stats_label.set_text(f"{len(items)}{more} matching tracks")
+        return False
+
+    def _build_index(self, generation):
+        index = self.player.library.artist_album_index()
+        GLib.idle_add(self._apply_index, generation, index)
+
+    def _apply_index(self, generation, index):
+        if generation != self._generation:
+            return False
+        nodes = [LibraryNode("artist", artist, count=sum(count for album, count in albums), albums=albums)
+                 for artist, albums in index]
+        self._merge_nodes(self.root_store, nodes)
+        tracks = sum(node.count for node in nodes)
+        album_count = sum(len(node.albums) for node in nodes)
+        self.stats_label.set_text(f"{len(nodes)} artists • {album_count} albums • {tracks} tracks")
+        return False
+
+    def _merge_nodes(self, store, nodes):
+        position = 0
+        pending = []
+        for node in nodes:
+            key = node.sort_key()
+            while position < store.get_n_items() and store.get_item(position).sort_key() < key:
+                store.remove(position)
+            current = store.get_item(position) if position < store.get_n_items() else None
+            if current is None or current.sort_key() != key:
+                pending.append(node)
+                continue
+            if pending:
+                store.splice(position, 0, pending)
+                position += len(pending)
+                pending = []
+            self._update_node(current, node)
+            position += 1
+        if pending or position < store.get_n_items():
+            store.splice(position, store.get_n_items() - position, pending)
+
+    def _update_node(self, current, node):
+        if current.count == node.count and current.albums == node.albums:
+            return
+        current.count = node.count
+        current.albums = node.albums
+        current.notify("label")
+        if current.children is None:
+            return
+        if current.kind == "artist":
+            self._merge_nodes(current.children, [LibraryNode("album", current.artist, album, count)
+                                                 for album, count in current.albums])
+        elif current.kind == "album":
+            self._load_tracks(current)
+
+    def on_row_activated(self, list_view, position):
+        row = self.tree_model.get_row(position)
+        node = row.get_item() if row is not None else None
+        if node is None:
+            return
+        if node.kind != "track":
+            row.set_expanded(not row.get_expanded())
+            return
+        path = node.item.path
+        index = self.player.find_track(path)
+        if index is not None:
+            self.player.play_track(index)
+            return
+
+        def play_added():
+            added = self.player.find_track(path)
+            if added is not None:
+                self.player.play_track(added)
+        self.player.add_to_playlist([path], on_finished=play_added)
 
 class PlayerTab(Gtk.Box):
     def __init__(self, player):
@@ -1059,11 +4955,23 @@ class WinampWindow(Gtk.ApplicationWindow):
         self.connect("notify::width", self.on_window_size_changed)
         self.connect("notify::height", self.on_window_size_changed)
         self.apply_xmms_css()
-        self.playlist = []
+        self.playlist = TrackList()
         self.current_track = -1
         self.shuffled_indices = []
+        self.shuffle_slots = []
         self.shuffle_position = 0
+        self._scanners = []
+        self.library = LibraryDatabase()
+        self.metadata = MetadataProber(on_results=self._on_metadata_ready, on_failed=self._on_metadata_failed)
+        self.preflight = PreflightValidator(on_results=self._refresh_playlist_rows, cache=self.metadata.cache,
+                                            on_sizes=self._on_file_sizes)
+        self.folder_watcher = FolderWatcher(on_changes=self._apply_folder_changes, tracks=lambda: self.playlist)
+        self.smart_playlists = SmartPlaylistManager()
+        self.history = PlaylistHistory()
+        self.journal = PlaylistJournal()
         self.settings = PlayerSettings()
+        self.settings_store = SettingsStore()
+        self.position_checkpoint = PositionCheckpoint()
         self.auto_play_next = self.settings.auto_play_next
         self.shuffle_mode = self.settings.shuffle_mode
         self.repeat_mode = self.settings.repeat_mode
@@ -1100,9 +5008,11 @@ class WinampWindow(Gtk.ApplicationWindow):
         self.player_tab = PlayerTab(self)
         self.equalizer_tab = EqualizerTab(self)
         self.playlist_tab = PlaylistTab(self)
+        self.library_tab = LibraryTab(self)
         self.notebook.append_page(self.player_tab, Gtk.Label(label="Player"))
         self.notebook.append_page(self.equalizer_tab, Gtk.Label(label="Equalizer"))
         self.notebook.append_page(self.playlist_tab, Gtk.Label(label="Playlist"))
+        self.notebook.append_page(self.library_tab, Gtk.Label(label="Library"))
         self.player_tab.play_btn.connect("clicked", self.on_play)
         self.player_tab.pause_btn.connect("clicked", self.on_pause)
         self.player_tab.stop_btn.connect("clicked", self.on_stop)
@@ -1130,7 +5040,11 @@ class WinampWindow(Gtk.ApplicationWindow):
         GLib.timeout_add(1000, self._apply_ui_settings_delayed)
         GLib.timeout_add(100, self.update_display)
         GLib.timeout_add(30000, self.periodic_auto_save)
+        GLib.timeout_add_seconds(POSITION_CHECKPOINT_INTERVAL, self._checkpoint_position)
+        GLib.timeout_add_seconds(SMART_TIMER_INTERVAL, self._check_smart_playlists)
         self.load_playlist()
+        self._resume_last_played()
+        self.folder_watcher.restore()
 
     def on_window_size_changed(self, widget, pspec):
         width = widget.get_width()
@@ -1170,21 +5084,15 @@ class WinampWindow(Gtk.ApplicationWindow):
 
     def save_settings(self):
         try:
-            SETTINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
-            with open(SETTINGS_FILE, 'w') as f:
-                json.dump(asdict(self.settings), f, indent=2)
-            pass
+            self.settings_store.save(self.settings)
         except Exception:
             pass
 
     def load_settings(self):
-        if SETTINGS_FILE.exists():
-            with open(SETTINGS_FILE, 'r') as f:
-                settings_dict = json.load(f)
-            self.settings = PlayerSettings(**settings_dict)
+        settings_dict = self.settings_store.load()
+        if settings_dict is not None:
+            self.settings = PlayerSettings.from_dict(settings_dict)
             self._apply_settings_to_state()
-            if hasattr(self.settings, 'last_played_track') and self.settings.last_played_track:
-                self._resume_last_played()
 
     def _update_settings_from_state(self):
         self.settings.auto_play_next = self.auto_play_next
@@ -1196,6 +5104,12 @@ class WinampWindow(Gtk.ApplicationWindow):
         self.settings.beat_threshold = self.beat_threshold
 
     def cleanup(self):
+        self.cancel_folder_scans()
+        self.folder_watcher.checkpoint()
+        self.preflight.shutdown()
+        self.metadata.shutdown()
+        self.library.close()
+        file_probe.shutdown()
         self._update_settings_from_state()
         self.save_settings()
         self.stop_beat_detection()
@@ -1212,18 +5126,36 @@ class WinampWindow(Gtk.ApplicationWindow):
         if hasattr(self, 'equalizer') and self.equalizer:
             GLib.idle_add(self.equalizer.set_state, Gst.State.NULL)
 
+    def _checkpoint_position(self):
+        if self.playing and 0 <= self.current_track < len(self.playlist) and hasattr(self, 'player') and self.player:
+            try:
+                success, position = self.player.query_position(Gst.Format.TIME)
+                if success:
+                    self.position_checkpoint.write(self.playlist[self.current_track].path, position / Gst.SECOND)
+            except Exception:
+                pass
+        return True
+
     def _resume_last_played(self):
-        if not self.settings.last_played_track:
-            return
         track_index = None
-        for i, item in enumerate(self.playlist):
-            if item.path == self.settings.last_played_track:
-                track_index = i
-                break
+        position = self.settings.last_played_position
+        checkpoint = self.position_checkpoint.read()
+        if checkpoint is not None:
+            track_id, checkpoint_position = checkpoint
+            if self.settings.last_played_track and \
+                    PositionCheckpoint.track_id(self.settings.last_played_track) == track_id:
+                track_index = self.find_track(self.settings.last_played_track)
+            else:
+                track_index = next((index for index, item in enumerate(self.playlist)
+                                    if PositionCheckpoint.track_id(item.path) == track_id), None)
+            if track_index is not None:
+                position = checkpoint_position
+        if track_index is None and self.settings.last_played_track:
+            track_index = self.find_track(self.settings.last_played_track)
         if track_index is not None:
             if self.play_track(track_index):
-                if self.settings.last_played_position > 2.0:
-                    GLib.timeout_add(1000, self._seek_to_position, self.settings.last_played_position)
+                if position > 2.0:
+                    GLib.timeout_add(1000, self._seek_to_position, position)
         else:
             pass
 
@@ -1257,6 +5189,7 @@ class WinampWindow(Gtk.ApplicationWindow):
                         self.settings.last_played_position = position / Gst.SECOND
                 except:
                     self.settings.last_played_position = 0.0
+            self.position_checkpoint.write(current_item.path, self.settings.last_played_position)
         if hasattr(self, 'player') and self.player:
             try:
                 volume = self.player.get_property("volume")
@@ -2077,16 +6010,26 @@ class WinampWindow(Gtk.ApplicationWindow):
             pass
 
     def setup_drag_drop(self):
-        self.dnd = Gtk.DropTarget.new(Gio.File, Gdk.DragAction.COPY)
+        self.dnd = Gtk.DropTarget.new(GObject.TYPE_NONE, Gdk.DragAction.COPY)
+        self.dnd.set_gtypes([Gdk.FileList, Gio.File])
         self.dnd.connect("drop", self.on_file_dropped)
         self.add_controller(self.dnd)
 
-    def on_file_dropped(self, drop, file, x, y):
-        path = file.get_path()
-        if path:
-            self.add_to_playlist([path])
-            if not self.playing and self.playlist:
-                self.play_track(0)
+    def on_file_dropped(self, drop, value, x, y):
+        if isinstance(value, Gdk.FileList):
+            files = value.get_files()
+        else:
+            files = [value]
+        paths = [f.get_path() for f in files if f is not None and f.get_path()]
+        if not paths:
+            return False
+        first_new = len(self.playlist)
+
+        def play_dropped():
+            if not self.playing and first_new < len(self.playlist):
+                self.play_track(first_new)
+
+        self.add_to_playlist(paths, on_finished=play_dropped)
         return True
 
     def _set_player_state_thread_safe(self, state):
@@ -2103,7 +6046,11 @@ class WinampWindow(Gtk.ApplicationWindow):
             return False
 
     def play_file(self, filepath, title=None):
-        if not os.path.exists(filepath):
+        available = file_probe.exists(filepath)
+        if available is None:
+            GLib.idle_add(self.set_status_message, "Storage not responding - try again shortly")
+            return False
+        if not available:
             pass
             return False
         try:
@@ -2136,8 +6083,7 @@ class WinampWindow(Gtk.ApplicationWindow):
                 GLib.idle_add(self.set_title, f"LinAmp - {track_name}")
             else:
                 GLib.idle_add(self.set_status_message, "Playback failed - trying next track")
-                if self.playlist and self.current_track < len(self.playlist) - 1:
-                    GLib.idle_add(self.play_track, self.current_track + 1)
+                GLib.idle_add(self._play_next_playable, self.current_track + 1)
         except Exception:
             return False
 
@@ -2202,12 +6148,14 @@ class WinampWindow(Gtk.ApplicationWindow):
                 except Exception as recovery_error:
                     pass
                     GLib.idle_add(self.set_status_message, "Recovery failed - trying next track")
-                    if self.playlist and self.current_track < len(self.playlist) - 1:
-                        GLib.idle_add(self.play_track, self.current_track + 1)
+                    GLib.idle_add(self._play_next_playable, self.current_track + 1)
             else:
                 GLib.idle_add(self.set_status_message, f"Error: {err.message}")
-                if self.playlist and self.current_track < len(self.playlist) - 1:
-                    GLib.idle_add(self.play_track, self.current_track + 1)
+                if 0 <= self.current_track < len(self.playlist):
+                    failed_item = self.playlist[self.current_track]
+                    self.preflight.record_failure(failed_item)
+                    self._refresh_playlist_rows([failed_item])
+                GLib.idle_add(self._play_next_playable, self.current_track + 1)
         elif message.type == Gst.MessageType.EOS:
             if self.auto_play_next:
                 if self.repeat_mode == "one":
@@ -2231,6 +6179,13 @@ class WinampWindow(Gtk.ApplicationWindow):
                     self.playing = False
         return Gst.BusSyncReply.PASS
 
+    def _play_next_playable(self, start):
+        for index in range(max(0, start), len(self.playlist)):
+            if self.playlist[index].playable is not False:
+                self.play_track(index)
+                break
+        return False
+
     def _attempt_recovery(self, uri):
         try:
             if not uri:
@@ -2239,14 +6194,12 @@ class WinampWindow(Gtk.ApplicationWindow):
             self.player.set_property("uri", uri)
             GLib.idle_add(self.player.set_state, Gst.State.PLAYING)
             GLib.idle_add(self.set_status_message, "Recovery failed - trying next track")
-            if self.playlist and self.current_track < len(self.playlist) - 1:
-                GLib.idle_add(self.play_track, self.current_track + 1)
+            GLib.idle_add(self._play_next_playable, self.current_track + 1)
             return False
         except Exception:
             pass
             GLib.idle_add(self.set_status_message, "Recovery error - trying next track")
-            if self.playlist and self.current_track < len(self.playlist) - 1:
-                GLib.idle_add(self.play_track, self.current_track + 1)
+            GLib.idle_add(self._play_next_playable, self.current_track + 1)
             return False
 
     def update_display(self):
@@ -2322,12 +6275,22 @@ class WinampWindow(Gtk.ApplicationWindow):
                 GLib.idle_add(self.player.set_state, Gst.State.NULL)
             if self.play_file(item.path, item.title):
                 self.current_track = index
+                item.play_count += 1
+                item.last_played = time.time()
+                self.journal.append('update', at=index, item=item)
+                self._refresh_playlist_rows([item])
+                self.library.record_play(item.path)
+                if self.smart_playlists.items_changed([item]) and hasattr(self, 'playlist_tab'):
+                    self.playlist_tab.refresh_view()
+                self.preflight.request(self.playlist[index + 1:index + 3], urgent=True)
                 self.save_settings_on_track_change()
-                if self.shuffle_mode and index in self.shuffled_indices:
-                    self.shuffle_position = self.shuffled_indices.index(index)
+                if self.shuffle_mode:
+                    slot = self._shuffle_slot(index)
+                    if slot is not None:
+                        self.shuffle_position = slot
                 if hasattr(self, 'playlist_tab') and hasattr(self.playlist_tab, 'selection_model'):
                     try:
-                        self.playlist_tab.selection_model.set_selected(index)
+                        self.playlist_tab.select_source_index(index)
                     except:
                         pass
                 return True
@@ -2346,11 +6309,19 @@ class WinampWindow(Gtk.ApplicationWindow):
     def get_previous_track_index(self):
         if not self.playlist:
             return None
+        index = self.current_track
+        for _ in range(len(self.playlist)):
+            index = self._previous_track_candidate(index)
+            if index is None or self.playlist[index].playable is not False:
+                return index
+        return None
+
+    def _previous_track_candidate(self, current):
         if self.shuffle_mode:
             return self.get_previous_shuffled_index()
         else:
-            if self.current_track > 0:
-                return self.current_track - 1
+            if current > 0:
+                return current - 1
             elif self.repeat_mode == "all":
                 return len(self.playlist) - 1
             else:
@@ -2380,10 +6351,8 @@ class WinampWindow(Gtk.ApplicationWindow):
         if self.shuffle_mode:
             self.regenerate_shuffle_list()
             if self.current_track >= 0:
-                try:
-                    self.shuffle_position = self.shuffled_indices.index(self.current_track)
-                except ValueError:
-                    self.shuffle_position = -1
+                slot = self._shuffle_slot(self.current_track)
+                self.shuffle_position = slot if slot is not None else -1
         self.update_status_display()
         self.auto_save_settings()
 
@@ -2492,11 +6461,19 @@ class WinampWindow(Gtk.ApplicationWindow):
     def get_next_track_index(self):
         if not self.playlist:
             return None
+        index = self.current_track
+        for _ in range(len(self.playlist)):
+            index = self._next_track_candidate(index)
+            if index is None or self.playlist[index].playable is not False:
+                return index
+        return None
+
+    def _next_track_candidate(self, current):
         if self.shuffle_mode:
             return self.get_next_shuffled_index()
         else:
-            if self.current_track < len(self.playlist) - 1:
-                return self.current_track + 1
+            if current < len(self.playlist) - 1:
+                return current + 1
             elif self.repeat_mode == "all":
                 return 0
             else:
@@ -2519,8 +6496,46 @@ class WinampWindow(Gtk.ApplicationWindow):
         self.original_indices = list(range(len(self.playlist)))
         self.shuffled_indices = self.original_indices.copy()
         random.shuffle(self.shuffled_indices)
+        self.shuffle_slots = [0] * len(self.shuffled_indices)
+        for slot, index in enumerate(self.shuffled_indices):
+            self.shuffle_slots[index] = slot
         self.shuffle_position = -1
 
+    def _extend_shuffle_list(self, start, count):
+        if not self.shuffled_indices:
+            return
+        if len(self.shuffled_indices) != start:
+            self.regenerate_shuffle_list()
+            return
+        added = list(range(start, start + count))
+        random.shuffle(added)
+        self.original_indices.extend(range(start, start + count))
+        self.shuffle_slots.extend([0] * count)
+        for index in added:
+            self.shuffle_slots[index] = len(self.shuffled_indices)
+            self.shuffled_indices.append(index)
+
+    def _shuffle_slot(self, index):
+        if 0 <= index < len(self.shuffle_slots):
+            slot = self.shuffle_slots[index]
+            if slot < len(self.shuffled_indices) and self.shuffled_indices[slot] == index:
+                return slot
+        return None
+
+    def _track_positions(self, path: str) -> List[int]:
+        if hasattr(self, 'playlist_tab'):
+            return self.playlist_tab.playlist_store.positions_of_path(path)
+        return [index for index, item in enumerate(self.playlist) if item.path == path]
+
+    def _has_track(self, path: str) -> bool:
+        if hasattr(self, 'playlist_tab'):
+            return self.playlist_tab.playlist_store.has_path(path)
+        return self.find_track(path) is not None
+
+    def find_track(self, path: str) -> Optional[int]:
+        positions = self._track_positions(path)
+        return positions[0] if positions else None
+
     def start_beat_detection(self):
         if not self.beat_aware_enabled or not self.playing:
             return
@@ -2636,57 +6651,322 @@ class WinampWindow(Gtk.ApplicationWindow):
     def on_pl_clicked(self, button):
         self.notebook.set_current_page(2)
 
-    def add_to_playlist(self, file_paths):
-        added_items = []
-        for path in file_paths:
-            if os.path.exists(path):
-                item = PlaylistItem(path=path, title=os.path.basename(path))
-                self.playlist.append(item)
-                added_items.append(item)
-        if hasattr(self, 'playlist_tab') and added_items:
-            for item in added_items:
-                self.playlist_tab.playlist_store.append(item.title)
-            self.playlist_tab.update_statistics()
-        self.save_playlist()
+    def add_to_playlist(self, file_paths, on_finished=None):
+        paths = [path for path in file_paths if path]
+        if not paths:
+            return None
+        return self._start_ingest(paths, on_finished=on_finished)
 
-    def add_folder_to_playlist(self, folder_path):
-        if not os.path.exists(folder_path) or not os.path.isdir(folder_path):
-            pass
-            return
-        added_items = []
-        audio_extensions = {'.mp3', '.mp4', '.flac', '.ogg', '.wav', '.m4a', '.wma', '.aac', '.opus'}
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_ext = os.path.splitext(file)[1].lower()
-                if file_ext in audio_extensions:
-                    try:
-                        rel_path = os.path.relpath(file_path, folder_path)
-                        title = rel_path if rel_path != file_path else file
-                        item = PlaylistItem(path=file_path, title=title)
-                        self.playlist.append(item)
-                        added_items.append(item)
-                    except Exception:
-                        pass
-        if added_items:
+    def add_folder_to_playlist(self, folder_path, on_finished=None):
+        if not folder_path:
+            return None
+        folder_path = os.path.abspath(os.path.expanduser(folder_path))
+        title_root = self.folder_watcher.root_for(folder_path) or folder_path
+        return self._start_ingest([folder_path], title_root, on_finished)
+
+    def _start_ingest(self, paths, title_root=None, on_finished=None):
+        group = object()
+
+        def finished(scanner):
+            if scanner in self._scanners:
+                self._scanners.remove(scanner)
             if hasattr(self, 'playlist_tab'):
-                for item in added_items:
-                    self.playlist_tab.playlist_store.append(item.title)
                 self.playlist_tab.update_statistics()
+            if scanner.cancelled:
+                return
+            for root in scanner.folder_roots:
+                prefix = root + os.sep
+                self.folder_watcher.watch(
+                    self.folder_watcher.root_for(root) or root,
+                    [d for d in scanner.directories if d == root or d.startswith(prefix)]
+                )
+            if scanner.files_found > 0:
+                self.save_playlist()
+            if on_finished:
+                on_finished()
+
+        scanner = LibraryScanner(
+            on_batch=lambda items: self._append_playlist_items(items, group),
+            on_progress=self._on_scan_progress,
+            on_finished=finished,
+            is_known=self._has_track
+        )
+        self._scanners.append(scanner)
+        scanner.start(paths, title_root)
+        return scanner
+
+    def _apply_folder_changes(self, added_files, added_dirs, removed, changed):
+        if removed:
+            removed_paths = set(removed)
+            removed_prefixes = tuple(path + os.sep for path in removed)
+            indices = [i for i, item in enumerate(self.playlist)
+                       if item.path in removed_paths or item.path.startswith(removed_prefixes)]
+            self.library.remove_paths([self.playlist[i].path for i in indices])
+            if hasattr(self, 'library_tab'):
+                self.library_tab.invalidate()
+            self.remove_playlist_indices(indices, record=False)
+        known_paths = set()
+        changed_items = [self.playlist[index] for path in set(changed) for index in self._track_positions(path)]
+        added_items = []
+        for path in added_files:
+            if path not in known_paths and not self._has_track(path):
+                root = self.folder_watcher.root_for(path) or os.path.dirname(path)
+                added_items.append(PlaylistItem(path=path, title=os.path.relpath(path, root)))
+                known_paths.add(path)
+        self.insert_playlist_items(len(self.playlist), added_items, record=False)
+        for directory in added_dirs:
+            root = self.folder_watcher.root_for(directory)
+            if root is not None:
+                self._start_ingest([directory], root)
+        if changed_items:
+            self.metadata.request(changed_items)
+        if removed or added_items:
+            self.history.clear()
             self.save_playlist()
-        else:
-            pass
+
+    def _on_file_sizes(self, sizes):
+        if not hasattr(self, 'playlist_tab'):
+            return
+        if self.playlist_tab.playlist_store.set_sizes(sizes):
+            self.playlist_tab.update_statistics()
+
+    def _refresh_playlist_rows(self, items):
+        if not items or not hasattr(self, 'playlist_tab'):
+            return
+        self.playlist_tab.playlist_store.refresh(items)
+
+    def remove_playlist_indices(self, indices, record=True):
+        indices = sorted({index for index in indices if 0 <= index < len(self.playlist)})
+        if not indices:
+            return
+        if record:
+            self.history.record(('remove', array('I', indices), [self.playlist[i] for i in indices]))
+        self.journal.append('remove', at=indices, paths=[self.playlist[i].path for i in indices])
+        start, end = indices[0], indices[-1] + 1
+        removed = set(indices)
+        self.smart_playlists.items_removed([self.playlist[i] for i in indices])
+        self.playlist[start:end] = [self.playlist[i] for i in range(start, end) if i not in removed]
+        if self.current_track in removed:
+            self.current_track = -1
+        elif self.current_track >= start:
+            self.current_track -= bisect.bisect_left(indices, self.current_track)
+        if hasattr(self, 'playlist_tab'):
+            self.playlist_tab.playlist_store.remove_positions(indices)
+        if self.shuffle_mode:
+            self.regenerate_shuffle_list()
+        if hasattr(self, 'playlist_tab'):
+            self.playlist_tab.update_statistics()
+            self.playlist_tab.refresh_view()
+
+    def move_playlist_indices(self, indices, target, record=True):
+        indices = sorted({index for index in indices if 0 <= index < len(self.playlist)})
+        if not indices:
+            return None
+        target = max(0, min(target, len(self.playlist)))
+        start = min(indices[0], target)
+        end = max(indices[-1] + 1, target)
+        moving = set(indices)
+        current_item = self.playlist[self.current_track] if 0 <= self.current_track < len(self.playlist) else None
+        before = [self.playlist[i] for i in range(start, target) if i not in moving]
+        moved = [self.playlist[i] for i in indices]
+        after = [self.playlist[i] for i in range(target, end) if i not in moving]
+        self.playlist[start:end] = before + moved + after
+        if hasattr(self, 'playlist_tab'):
+            self.playlist_tab.playlist_store.move_positions(indices, target)
+            self.playlist_tab.refresh_view()
+        if current_item is not None and start <= self.current_track < end:
+            self.current_track = start + next(i for i, item in enumerate(before + moved + after)
+                                              if item == current_item)
+        if self.shuffle_mode:
+            self.regenerate_shuffle_list()
+        if record:
+            self.history.record(('move', array('I', indices), target, start + len(before)))
+        self.journal.append('move', at=indices, to=start + len(before), paths=[item.path for item in moved])
+        return start + len(before)
+
+    def insert_playlist_items(self, position, items, record=True, group=None):
+        if not items:
+            return
+        position = max(0, min(position, len(self.playlist)))
+        if record:
+            self.history.record_insert(position, items, group)
+        self.journal.append('insert', at=position, items=tuple(items))
+        appending = position == len(self.playlist)
+        self.playlist[position:position] = items
+        if self.current_track >= position:
+            self.current_track += len(items)
+        if self.shuffle_mode:
+            if appending:
+                self._extend_shuffle_list(position, len(items))
+            else:
+                self.regenerate_shuffle_list()
+        if hasattr(self, 'playlist_tab'):
+            self.playlist_tab.playlist_store.splice(position, 0, items)
+            self.playlist_tab.update_statistics()
+        self.library.add_items(items)
+        if hasattr(self, 'library_tab'):
+            self.library_tab.invalidate()
+        self.metadata.request(items)
+        self.preflight.request(items)
+        if self.smart_playlists.items_added(items) and hasattr(self, 'playlist_tab'):
+            self.playlist_tab.refresh_view()
+
+    def _append_playlist_items(self, items, group=None):
+        self.insert_playlist_items(len(self.playlist), items, group=group)
+
+    def clear_playlist(self, record=True):
+        if record and self.playlist:
+            self.history.record(('clear', self.playlist.copy()))
+        self.journal.append('clear')
+        self._clear_playlist_store()
+        self.playlist.clear()
+        self.smart_playlists.rebuild([])
+        self.current_track = -1
+        self.shuffled_indices = []
+        self.shuffle_slots = []
+        if hasattr(self, 'playlist_tab'):
+            if self.playlist_tab.search_rows is not None:
+                self.playlist_tab._show_search_results([])
+            self.playlist_tab.update_statistics()
+
+    def shuffle_playlist(self):
+        if not self.playlist:
+            return
+        order = array('I', range(len(self.playlist)))
+        random.shuffle(order)
+        self.history.record(('permute', order))
+        self._restore_playlist(TrackList.from_ids(map(self.playlist.ids.__getitem__, order)))
+
+    @staticmethod
+    def _merge_at(base, indices, items):
+        merged = []
+        cursor = 0
+        for index, item in zip(indices, items):
+            take = index - len(merged)
+            merged.extend(base[cursor:cursor + take])
+            cursor += take
+            merged.append(item)
+        merged.extend(base[cursor:])
+        return merged
+
+    def _restore_playlist(self, items, added=None, removed=None):
+        current_item = self.playlist[self.current_track] if 0 <= self.current_track < len(self.playlist) else None
+        self.playlist[:] = items
+        self.journal.compact(self.playlist)
+        self.current_track = -1
+        if removed:
+            self.smart_playlists.items_removed(removed)
+        if added:
+            self.smart_playlists.items_added(added)
+        if hasattr(self, 'playlist_tab'):
+            store = self.playlist_tab.playlist_store
+            store.reset(self.playlist)
+            if current_item is not None:
+                position = store.position_of(current_item)
+                self.current_track = -1 if position is None else position
+        elif current_item is not None:
+            self.current_track = next((i for i, item in enumerate(self.playlist) if item == current_item), -1)
+        if self.shuffle_mode:
+            self.regenerate_shuffle_list()
+        if hasattr(self, 'playlist_tab'):
+            self.playlist_tab.update_statistics()
+            self.playlist_tab.refresh_view()
+
+    def undo_playlist_edit(self) -> bool:
+        entry = self.history.undo()
+        if entry is None:
+            return False
+        kind = entry[0]
+        if kind == 'insert':
+            position, items = entry[1], entry[2]
+            self.remove_playlist_indices(range(position, position + len(items)), record=False)
+        elif kind == 'remove':
+            self._restore_playlist(self._merge_at(self.playlist, entry[1], entry[2]), added=entry[2])
+        elif kind == 'move':
+            indices, start = entry[1], entry[3]
+            end = start + len(indices)
+            base = self.playlist[:start] + self.playlist[end:]
+            self._restore_playlist(self._merge_at(base, indices, self.playlist[start:end]))
+        elif kind == 'permute':
+            previous = array('I', self.playlist.ids)
+            for row, index in zip(self.playlist.ids, entry[1]):
+                previous[index] = row
+            self._restore_playlist(TrackList.from_ids(previous))
+        elif kind == 'clear':
+            self._restore_playlist(entry[1], added=entry[1])
+        self.save_playlist()
+        return True
+
+    def redo_playlist_edit(self) -> bool:
+        entry = self.history.redo()
+        if entry is None:
+            return False
+        kind = entry[0]
+        if kind == 'insert':
+            self.insert_playlist_items(entry[1], list(entry[2]), record=False)
+        elif kind == 'remove':
+            self.remove_playlist_indices(entry[1], record=False)
+        elif kind == 'move':
+            self.move_playlist_indices(entry[1], entry[2], record=False)
+        elif kind == 'permute':
+            self._restore_playlist(TrackList.from_ids(map(self.playlist.ids.__getitem__, entry[1])))
+        elif kind == 'clear':
+            self.clear_playlist(record=False)
+        self.save_playlist()
+        return True
+
+    def _check_smart_playlists(self):
+        if self.smart_playlists.update_due() and hasattr(self, 'playlist_tab'):
+            self.playlist_tab.refresh_view()
+        return True
+
+    def _on_metadata_failed(self, items):
+        if hasattr(self, 'playlist_tab'):
+            self.playlist_tab.playlist_store.set_details(items, TrackMetadata())
+
+    def _on_metadata_ready(self, resolved):
+        if hasattr(self, 'playlist_tab'):
+            for metadata, items in resolved.values():
+                self.playlist_tab.playlist_store.set_details(items, metadata)
+        for path, (metadata, items) in resolved.items():
+            if items:
+                self.journal.append('tags', path=path, duration=metadata.duration, artist=metadata.artist,
+                                    album=metadata.album, genre=metadata.genre)
+        self.save_playlist()
+        self.library.update_metadata({path: metadata for path, (metadata, items) in resolved.items()})
+        if hasattr(self, 'library_tab'):
+            self.library_tab.invalidate()
+        changed_items = [item for metadata, items in resolved.values() for item in items]
+        if self.smart_playlists.items_changed(changed_items) and hasattr(self, 'playlist_tab'):
+            self.playlist_tab.refresh_view()
+        if hasattr(self, 'playlist_tab'):
+            self.playlist_tab.update_statistics()
+        if 0 <= self.current_track < len(self.playlist):
+            current_item = self.playlist[self.current_track]
+            if current_item.path in resolved and hasattr(self, 'player_tab'):
+                self.player_tab.update_track_info(current_item.title, current_item.artist, current_item.album)
+
+    def _on_scan_progress(self, dirs_scanned, files_found):
+        if hasattr(self, 'playlist_tab'):
+            self.playlist_tab.stats_label.set_text(
+                f"Scanning… {files_found} tracks in {dirs_scanned} folders"
+            )
+
+    def cancel_folder_scans(self):
+        for scanner in list(self._scanners):
+            scanner.cancel()
+        self._scanners.clear()
 
     def save_playlist(self, filepath: str = None) -> bool:
+        if not filepath:
+            if self.journal.needs_compaction():
+                return self.journal.compact(self.playlist)
+            return True
         if not hasattr(self, 'playlist') or not self.playlist:
             pass
             return False
-        if not filepath:
-            playlist_dir = os.path.expanduser("~/.config/linamp")
-            filepath = os.path.join(playlist_dir, "playlist.json")
-        else:
-            filepath = os.path.abspath(os.path.expanduser(filepath))
-            playlist_dir = os.path.dirname(filepath)
+        filepath = os.path.abspath(os.path.expanduser(filepath))
+        playlist_dir = os.path.dirname(filepath)
         try:
             os.makedirs(playlist_dir, exist_ok=True)
         except (OSError, PermissionError) as e:
@@ -2697,7 +6977,7 @@ class WinampWindow(Gtk.ApplicationWindow):
             for item in self.playlist:
                 try:
                     if hasattr(item, 'to_dict') and callable(item.to_dict):
-                        if hasattr(item, 'path') and item.path and os.path.exists(item.path):
+                        if hasattr(item, 'path') and item.path and not file_probe.known_missing(item.path):
                             playlist_data.append(item.to_dict())
                         else:
                             pass
@@ -2746,116 +7026,87 @@ class WinampWindow(Gtk.ApplicationWindow):
             return False
         try:
             store = self.playlist_tab.playlist_store
-            store.freeze_notify()
-            if hasattr(store, 'splice') and callable(store.splice):
-                store.splice(0, store.get_n_items(), [])
-            else:
-                while store.get_n_items() > 0:
-                    store.remove(store.get_n_items() - 1)
+            store.splice(0, len(store), [])
             return True
         except Exception:
             pass
             return False
-        finally:
-            if 'store' in locals():
-                try:
-                    store.thaw_notify()
-                except Exception:
-                    pass
 
     def _update_playlist_display(self) -> bool:
         if not hasattr(self, 'playlist_tab') or not hasattr(self.playlist_tab, 'playlist_store'):
             pass
             return False
         try:
-            store = self.playlist_tab.playlist_store
-            if not self.playlist:
-                pass
-                return True
-            store.freeze_notify()
-            display_names = []
-            for item in self.playlist:
-                try:
-                    if isinstance(item, PlaylistItem):
-                        display_names.append(item.get_display_name())
-                    elif isinstance(item, dict):
-                        display_names.append(item.get('title') or os.path.basename(item.get('path', '')))
-                    else:
-                        display_names.append(str(item))
-                except Exception:
-                    pass
-                    display_names.append("<Invalid Item>")
-            if hasattr(store, 'splice') and callable(store.splice):
-                store.splice(0, store.get_n_items(), display_names)
-            else:
-                for name in display_names:
-                    store.append(name)
-            pass
+            self.playlist_tab.playlist_store.reset(self.playlist)
+            if self.shuffle_mode and len(self.shuffled_indices) != len(self.playlist):
+                self.regenerate_shuffle_list()
             return True
         except Exception:
             pass
             return False
         finally:
-            if 'store' in locals():
-                try:
-                    store.thaw_notify()
-                except Exception:
-                    pass
             if hasattr(self, 'playlist_tab') and hasattr(self.playlist_tab, 'update_statistics'):
                 self.playlist_tab.update_statistics()
+                self.playlist_tab.refresh_view()
 
     def load_playlist(self, filepath: str = None) -> bool:
+        records = []
         if not filepath:
-            playlist_dir = os.path.expanduser("~/.config/linamp")
-            filepath = os.path.join(playlist_dir, "playlist.json")
+            playlist, records = self.journal.load()
+            data = playlist
         else:
             filepath = os.path.abspath(os.path.expanduser(filepath))
-        if not os.path.exists(filepath):
-            return False
-        if not os.access(filepath, os.R_OK):
-            pass
-            return False
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                    if not isinstance(data, list):
+            if not file_probe.isfile(filepath):
+                return False
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    try:
+                        data = json.load(f)
+                        if not isinstance(data, list):
+                            pass
+                            return False
+                    except json.JSONDecodeError:
                         pass
                         return False
-                except json.JSONDecodeError:
-                    pass
-                    return False
-        except (IOError, OSError):
-            pass
-            return False
-        except Exception:
-            pass
-            return False
-        playlist = []
-        invalid_items = 0
-        for i, item_data in enumerate(data, 1):
-            try:
-                if not isinstance(item_data, dict):
-                    pass
-                    invalid_items += 1
-                    continue
+            except (IOError, OSError):
+                pass
+                return False
+            except Exception:
+                pass
+                return False
+            playlist = TrackList()
+            invalid_items = 0
+            for i, item_data in enumerate(data, 1):
                 try:
-                    item = PlaylistItem.from_dict(item_data)
-                    if not item.exists():
+                    if not isinstance(item_data, dict):
                         pass
-                    playlist.append(item)
-                except ValueError:
+                        invalid_items += 1
+                        continue
+                    try:
+                        item = PlaylistItem.from_dict(item_data)
+                        playlist.append(item)
+                    except ValueError:
+                        pass
+                        invalid_items += 1
+                except Exception:
                     pass
                     invalid_items += 1
-            except Exception:
-                pass
-                invalid_items += 1
+        self.journal.replay(playlist, records)
+        if filepath or records or self.journal.imported or self.journal.dropped:
+            self.journal.compact(playlist)
         self.playlist = playlist
+        self.history.clear()
+        self.smart_playlists.rebuild(playlist)
         total_items = len(data)
         loaded_items = len(playlist)
         if hasattr(self, 'playlist_tab') and self.playlist_tab:
             self._clear_playlist_store()
             self._update_playlist_display()
+        self.library.add_items(playlist)
+        if hasattr(self, 'library_tab'):
+            self.library_tab.invalidate()
+        self.metadata.request([item for item in playlist if item.duration <= 0])
+        self.preflight.request(playlist)
         return len(playlist) > 0
 
 class LinAmpApp(Gtk.Application):
@@ -2876,6 +7127,9 @@ class LinAmpApp(Gtk.Application):
     def do_shutdown(self):
         if self.win:
             self.win.cleanup()
+            self.win.journal.flush()
+            self.win.settings_store.flush()
+            self.win.position_checkpoint.close()
         Gtk.Application.do_shutdown(self)
 
     def do_startup(self):
@@ -2884,9 +7138,7 @@ class LinAmpApp(Gtk.Application):
         if len(sys.argv) > 1:
             if not self.win:
                 self.win = WinampWindow(application=self, title="LinAmp")
-            self.win.add_to_playlist(sys.argv[1:])
-            if self.win.playlist:
-                self.win.play_track(0)
+            self.win.add_to_playlist(sys.argv[1:], on_finished=self._play_first_track)
 
     def setup_menu(self):
         open_action = Gio.SimpleAction.new("open", None)
@@ -2899,11 +7151,19 @@ class LinAmpApp(Gtk.Application):
         add_folder_to_playlist_action.connect("activate", self.on_add_folder_to_playlist)
         quit_action = Gio.SimpleAction.new("quit", None)
         quit_action.connect("activate", lambda *_: self.quit())
+        undo_action = Gio.SimpleAction.new("undo", None)
+        undo_action.connect("activate", lambda *_: self.win and self.win.undo_playlist_edit())
+        redo_action = Gio.SimpleAction.new("redo", None)
+        redo_action.connect("activate", lambda *_: self.win and self.win.redo_playlist_edit())
         self.add_action(open_action)
         self.add_action(open_folder_action)
         self.add_action(add_to_playlist_action)
         self.add_action(add_folder_to_playlist_action)
         self.add_action(quit_action)
+        self.add_action(undo_action)
+        self.add_action(redo_action)
+        self.set_accels_for_action("app.undo", ["<Control>z"])
+        self.set_accels_for_action("app.redo", ["<Control><Shift>z", "<Control>y"])
         menu = Gio.Menu()
         file_menu = Gio.Menu()
         file_menu.append("Open File", "app.open")
@@ -2912,6 +7172,10 @@ class LinAmpApp(Gtk.Application):
         file_menu.append("Add Folder to Playlist", "app.add_folder_to_playlist")
         file_menu.append("Quit", "app.quit")
         menu.append_submenu("File", file_menu)
+        edit_menu = Gio.Menu()
+        edit_menu.append("Undo", "app.undo")
+        edit_menu.append("Redo", "app.redo")
+        menu.append_submenu("Edit", edit_menu)
         self.set_menubar(menu)
 
     def on_open(self, action, param):
@@ -2963,13 +7227,9 @@ class LinAmpApp(Gtk.Application):
         if response == Gtk.ResponseType.ACCEPT:
             file = dialog.get_file()
             if file:
-                self.win.playlist.clear()
-                if hasattr(self.win, 'playlist_tab'):
-                    store = self.win.playlist_tab.playlist_store
-                    while store.get_n_items() > 0:
-                        store.remove(0)
-                self.win.add_to_playlist([file.get_path()])
-                self.win.play_track(0)
+                self.win.cancel_folder_scans()
+                self.win.clear_playlist()
+                self.win.add_to_playlist([file.get_path()], on_finished=self._play_first_track)
         dialog.destroy()
 
     def on_add_to_playlist_response(self, dialog, response):
@@ -2978,9 +7238,10 @@ class LinAmpApp(Gtk.Application):
             file_paths = [f.get_path() for f in files if f.get_path()]
             if file_paths:
                 was_empty = not self.win.playlist
-                self.win.add_to_playlist(file_paths)
-                if was_empty and self.win.playlist:
-                    self.win.play_track(0)
+                self.win.add_to_playlist(
+                    file_paths,
+                    on_finished=self._play_first_track if was_empty else None
+                )
         dialog.destroy()
 
     def on_folder_chooser_response(self, dialog, response):
@@ -2988,14 +7249,10 @@ class LinAmpApp(Gtk.Application):
             folder = dialog.get_file()
             if folder:
                 folder_path = folder.get_path()
-                self.win.playlist.clear()
-                if hasattr(self.win, 'playlist_tab'):
-                    store = self.win.playlist_tab.playlist_store
-                    while store.get_n_items() > 0:
-                        store.remove(0)
-                self.win.add_folder_to_playlist(folder_path)
-                if self.win.playlist:
-                    self.win.play_track(0)
+                self.win.cancel_folder_scans()
+                self.win.folder_watcher.clear()
+                self.win.clear_playlist()
+                self.win.add_folder_to_playlist(folder_path, on_finished=self._play_first_track)
         dialog.destroy()
 
     def on_add_folder_to_playlist_response(self, dialog, response):
@@ -3004,12 +7261,21 @@ class LinAmpApp(Gtk.Application):
             if folder:
                 folder_path = folder.get_path()
                 was_empty = not self.win.playlist
-                self.win.add_folder_to_playlist(folder_path)
-                if was_empty and self.win.playlist:
-                    self.win.play_track(0)
+                self.win.add_folder_to_playlist(
+                    folder_path,
+                    on_finished=self._play_first_track if was_empty else None
+                )
         dialog.destroy()
 
+    def _play_first_track(self):
+        if self.win.playlist:
+            self.win.play_track(0)
+
 def main():
+    try:
+        locale.setlocale(locale.LC_COLLATE, '')
+    except locale.Error:
+        pass
     app = LinAmpApp()
     app.run(sys.argv)
 
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+pytest.importorskip("gi")
+
+from linamp_xmms import (PlaylistItem, PlaylistJournal, TrackList, intern_tag, read_playlist_snapshot, track_store,
+                         write_playlist_snapshot)
+
+
+def write_and_read(tmp_path, items, sequence=0):
+    path = tmp_path / "playlist.bin"
+    with open(path, 'wb') as f:
+        write_playlist_snapshot(f, items, sequence)
+    return read_playlist_snapshot(str(path))
+
+
+def test_empty_playlist_round_trip(tmp_path):
+    sequence, loaded = write_and_read(tmp_path, [], 5)
+    assert sequence == 5 and len(loaded) == 0
+
+
+def test_round_trip_keeps_fields(tmp_path):
+    items = [
+        PlaylistItem(path="/music/caf\udce9/01 Intro.flac", title="Intro", duration=61, artist="Björk",
+                     album="Homogenic", genre="Electronic", play_count=3, last_played=12.5),
+        PlaylistItem(path="/music/b.mp3", artist="Björk"),
+    ]
+    sequence, loaded = write_and_read(tmp_path, items, 7)
+    assert sequence == 7
+    assert [item.to_dict() for item in loaded] == [item.to_dict() for item in items]
+    assert loaded[0].artist is loaded[1].artist
+    assert loaded[0].album is intern_tag(''.join(['Homo', 'genic']))
+
+
+def test_round_trip_shares_folder_prefixes(tmp_path):
+    items = [PlaylistItem(path="/music/album/01.flac"), PlaylistItem(path="/music/album/02.flac", title="Two")]
+    sequence, loaded = write_and_read(tmp_path, items)
+    assert [item.path for item in loaded] == ["/music/album/01.flac", "/music/album/02.flac"]
+    assert loaded[0].folder is loaded[1].folder is items[0].folder
+    assert loaded[0].title == loaded[0].name
+    assert track_store.title_start[loaded[0].id] == track_store.name_start[loaded[0].id]
+
+
+def test_track_list_holds_row_ids():
+    items = TrackList([PlaylistItem(path="/music/a.mp3"), PlaylistItem(path="/music/a.mp3", title="Copy")])
+    first, copy = items[0], items[1]
+    first.play_count = 4
+    assert items[0] == first and items[0] is not first and copy != first
+    assert items[0].play_count == 4 and copy.title == "Copy"
+    items[0:0] = [copy]
+    del items[1]
+    assert list(items.ids) == [copy.id, copy.id]
+
+
+def test_cleared_playlist_does_not_resurrect_legacy_json(tmp_path):
+    legacy = tmp_path / "playlist.json"
+    legacy.write_text(json.dumps([{'path': "/music/old.mp3"}]))
+    journal = PlaylistJournal(str(tmp_path / "playlist.bin"), str(tmp_path / "playlist.journal"),
+                              interval=0, legacy_path=str(legacy))
+    items, records = journal.load()
+    assert [item.path for item in items] == ["/music/old.mp3"] and journal.imported
+    journal.compact(items)
+    journal.flush()
+    assert not legacy.exists()
+    journal.compact([])
+    journal.flush()
+    reloaded = PlaylistJournal(str(tmp_path / "playlist.bin"), str(tmp_path / "playlist.journal"),
+                               legacy_path=str(legacy))
+    items, records = reloaded.load()
+    assert len(items) == 0 and records == []
+    assert not reloaded.imported